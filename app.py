@@ -1,39 +1,69 @@
-from dash import dcc, html, Dash
 import os
-from dash_extensions import Lottie  # Import Lottie for loading animations
-from utils import load_and_standardize_data
-from callbacks import register_callbacks
-from layout import create_layout
-import pandas as pd
-
-# List CSV files in the directory
-csv_files = [f for f in os.listdir('./tickerHistory/') if f.endswith('.csv')]
-if 'GME.csv' in csv_files:
-    csv_files.remove('GME.csv')
-    csv_files.insert(0, 'GME.csv')
-
-initial_file = f'./tickerHistory/{csv_files[0]}'
-df = load_and_standardize_data(initial_file)
-latest_date = df['Date'].max()
-three_months_ago = latest_date - pd.Timedelta(days=90)
-five_years_ago = latest_date - pd.Timedelta(days=5*365)
-three_months_data = df[(df['Date'] >= three_months_ago) & (df['Date'] <= latest_date)]
-ftd_df = pd.read_csv("./ftd_data/GME_FTD.csv")
-ftd_df['SETTLEMENT DATE'] = pd.to_datetime(ftd_df['SETTLEMENT DATE'], format='%Y%m%d')
-ftd_df = ftd_df[ftd_df['QUANTITY (FAILS)'] > 150000]
-
-# Initialize the Dash app
+import threading
+
 external_stylesheets = [
     './assets/styles.css',
     'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/5.15.3/css/all.min.css'  # Font Awesome for gear icon
 ]
-app = Dash(__name__, external_stylesheets=external_stylesheets)
+# Load the default ticker and its FTDs in a background thread at startup, so
+# the first page load doesn't pay for parsing them
+PREWARM = os.environ.get('PREWARM', '1') not in ('', '0')
+# Best-fit jobs run in their own processes and report progress and results
+# through a disk cache here, so no broker is needed
+JOB_DIR = os.environ.get('JOB_DIR', './.jobs')
+
+
+def prewarm():
+    from utils import get_ftd_data, list_ticker_files, update_graph
+
+    csv_files = list_ticker_files()
+    if csv_files:
+        # Building the default figure once also maps the ticker's sidecar and
+        # pyramid and fills plotly's validator cache
+        update_graph(None, get_ftd_data(csv_files[0]), csv_files[0], 'no', None, None, None, None,
+                     0, 1, 1, 0, 0, ['volume', 'open_price'], None)
+
+
+def create_app(prewarm_data=PREWARM):
+    # dash, pandas, plotly and dash_daq are imported here rather than at module
+    # level, so importing app.py (tests, tooling, a preloading gunicorn master)
+    # costs nothing until an app is actually built
+    import diskcache
+    from dash import Dash, DiskcacheManager
+    from callbacks import register_callbacks
+    from instrumentation import ENABLED as INSTRUMENTATION_ENABLED, instrument
+    from layout import create_layout
+    from utils import ticker_cache
+
+    app = Dash(
+        __name__, external_stylesheets=external_stylesheets,
+        background_callback_manager=DiskcacheManager(diskcache.Cache(JOB_DIR))
+    )
+    if INSTRUMENTATION_ENABLED:
+        # Opt-in callback timing, /metrics and the debug panel; see README
+        instrument(app, ticker_cache)
+
+    # A layout function is evaluated per page load, so no data is read here
+    app.layout = create_layout
+    register_callbacks(app)
+
+    if prewarm_data:
+        threading.Thread(target=prewarm, name='prewarm', daemon=True).start()
+    return app
+
+
+_app = None
+
 
-# Set the layout
-app.layout = create_layout(latest_date, five_years_ago, csv_files)
+def __getattr__(name):
+    # `app.app` and `app.server` (e.g. `gunicorn app:server`) build the app on first access
+    global _app
+    if name not in ('app', 'server'):
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    if _app is None:
+        _app = create_app()
+    return _app if name == 'app' else _app.server
 
-# Register callbacks
-register_callbacks(app, df, ftd_df, three_months_data)
 
 if __name__ == '__main__':
-    app.run_server(debug=True)
+    create_app().run(debug=True)
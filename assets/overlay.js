@@ -0,0 +1,66 @@
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    overlay: {
+        // Browser-side copy of the overlay math in utils.update_graph. The base
+        // arrays come from the overlay-store once per ticker/range change, so
+        // slider drags only restyle the two overlay traces locally.
+        transform: function(move, yScale, xScale, yOffset, logScale, base, figure, relayoutData) {
+            if (!base || !figure || !figure.data || !base.dates.length) {
+                return window.dash_clientside.no_update;
+            }
+            move = parseFloat(move);
+            yScale = parseFloat(yScale);
+            xScale = parseFloat(xScale);
+            yOffset = parseFloat(yOffset);
+            logScale = parseFloat(logScale);
+
+            var n = base.dates.length;
+            var shift = move * 86400000;
+            // Dates arrive sorted; spreading a long array into Math.min overflows the stack
+            var first = base.dates[0] + shift;
+            var last = base.dates[n - 1] + shift;
+            var range = last - first;
+
+            var x = new Array(n);
+            var y = new Array(n);
+            var volume = new Array(n);
+            for (var i = 0; i < n; i++) {
+                var date = base.dates[i] + shift;
+                if (range !== 0) {
+                    date = first + (date - first) * xScale;
+                }
+                // Naive ISO string, matching how the server serializes dates
+                x[i] = new Date(date).toISOString().slice(0, 23).replace('T', ' ');
+                // Null values are gaps at the start of an indicator
+                var value = base.values[i];
+                var price = logScale > 0 ? Math.log(value) * logScale : value;
+                y[i] = value === null ? null : price * yScale + yOffset;
+                volume[i] = base.volume[i] * yScale;
+            }
+
+            var data = figure.data.map(function(trace) {
+                if (trace.name === 'Overlay Data') {
+                    return Object.assign({}, trace, {x: x, y: y});
+                }
+                if (trace.name === 'Overlay Volume') {
+                    return Object.assign({}, trace, {x: x, y: volume});
+                }
+                return trace;
+            });
+
+            // Keep the user's current zoom, like update_graph does with relayoutData
+            var layout = Object.assign({}, figure.layout);
+            if (relayoutData) {
+                ['xaxis', 'yaxis', 'yaxis2'].forEach(function(axis) {
+                    var range = relayoutData[axis + '.range'];
+                    if (relayoutData[axis + '.range[0]'] !== undefined) {
+                        range = [relayoutData[axis + '.range[0]'], relayoutData[axis + '.range[1]']];
+                    }
+                    if (range) {
+                        layout[axis] = Object.assign({}, layout[axis], {range: range, autorange: false});
+                    }
+                });
+            }
+            return Object.assign({}, figure, {data: data, layout: layout});
+        }
+    }
+});
@@ -0,0 +1,313 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import plotly.io as pio
+
+from fitting import FitProblem
+from ftd_store import ingest_ftd, source_files
+from indicators import INDICATORS, compute, extend, input_columns
+from pyramid import INTRADAY_LEVELS, LEVELS, level_path
+from store import sidecar_path
+
+# Synthetic dataset sizes, in daily rows
+DEFAULT_SIZES = (10_000, 100_000, 1_000_000)
+# Last date of every synthetic history, matching the bundled exports
+SYNTHETIC_END = pd.Timestamp('2024-07-05')
+# Rows per year for each spacing the generator can fall back to
+ROWS_PER_YEAR = {'B': 261, 'D': 365, 'h': 24 * 365}
+FIT_CALLS = 50
+SOLVE_CANDIDATES = 10_000
+# Seconds each startup step may take (median) before --check-budget fails the run
+STARTUP_BUDGET = {'import_app': 0.05, 'create_app': 2.0, 'first_request': 1.0}
+# Run in a fresh interpreter per sample, as a new gunicorn worker would be
+STARTUP_SCRIPT = """
+import json, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+instance = app.create_app(prewarm_data=False)
+created = time.perf_counter()
+client = instance.server.test_client()
+client.get('/')
+client.get('/_dash-layout')
+client.get('/_dash-dependencies')
+served = time.perf_counter()
+print(json.dumps({'import_app': imported - start, 'create_app': created - imported, 'first_request': served - created}))
+"""
+
+
+def synthetic_dates(rows):
+    # Business days like a real export while they fit in datetime64[ns], whose
+    # range starts in 1677; bigger sizes fall back to calendar days, then hours
+    for freq, per_year in ROWS_PER_YEAR.items():
+        if rows / per_year < SYNTHETIC_END.year - 1700:
+            return pd.date_range(end=SYNTHETIC_END, periods=rows, freq=freq), freq
+    raise ValueError(f'{rows} rows do not fit in datetime64[ns]')
+
+
+def write_synthetic_ticker(path, rows, seed=0):
+    # Geometric random walk written the way Nasdaq exports it: newest row
+    # first, prices as '$24.45'
+    rng = np.random.default_rng(seed)
+    dates, freq = synthetic_dates(rows)
+    close = 20.0 * np.exp(np.cumsum(rng.normal(0.0, 0.02, rows)))
+    open_ = close * np.exp(rng.normal(0.0, 0.005, rows))
+    high = np.maximum(open_, close) * (1 + rng.uniform(0.0, 0.02, rows))
+    low = np.minimum(open_, close) * (1 - rng.uniform(0.0, 0.02, rows))
+
+    def money(values):
+        return pd.Series(np.round(values, 2)).map('${:.2f}'.format)
+
+    df = pd.DataFrame({
+        'Date': dates.strftime('%m/%d/%Y' if freq != 'h' else '%m/%d/%Y %H:%M'),
+        'Close/Last': money(close),
+        'Volume': rng.lognormal(15.0, 1.0, rows).astype(np.int64),
+        'Open': money(open_),
+        'High': money(high),
+        'Low': money(low),
+    })
+    df.iloc[::-1].to_csv(path, index=False)
+    return dates, open_
+
+
+def write_synthetic_ftd(path, symbol, dates, prices, seed=0):
+    # A pipe-delimited cnsfails file with one row per settlement day in the
+    # ticker's range, fail quantities spread around the default 150000
+    # threshold, and the SEC's trailer line
+    rng = np.random.default_rng(seed + 1)
+    days = pd.Series(dates.normalize())
+    first = ~days.duplicated().to_numpy()
+    days = days[first]
+    pd.DataFrame({
+        'SETTLEMENT DATE': days.dt.strftime('%Y%m%d').to_numpy(),
+        'CUSIP': '000000000',
+        'SYMBOL': symbol,
+        'QUANTITY (FAILS)': np.round(rng.lognormal(11.0, 1.5, len(days))).astype(np.int64),
+        'DESCRIPTION': 'SYNTHETIC CORP',
+        'PRICE': np.round(prices[first], 2),
+    }).to_csv(path, sep='|', index=False)
+    with open(path, 'a') as f:
+        f.write(f'Trailer record count {len(days)}\n')
+
+
+def prepare_datasets(data_dir, sizes, include_real=True):
+    # (name, ticker csv, ftd directory) per dataset. Generated files are
+    # reused between runs; real tickers and FTD files are copied so cold loads
+    # never touch the stored columns in tickerHistory and ftd_data
+    from utils import FTD_DIR, TICKER_DIR, list_ticker_files
+
+    datasets = []
+    if include_real:
+        real_dir = os.path.join(data_dir, 'real')
+        real_ftd_dir = os.path.abspath(os.path.join(data_dir, 'real-ftd'))
+        os.makedirs(real_dir, exist_ok=True)
+        os.makedirs(real_ftd_dir, exist_ok=True)
+        for name in source_files(FTD_DIR):
+            shutil.copyfile(os.path.join(FTD_DIR, name), os.path.join(real_ftd_dir, name))
+        for name in list_ticker_files(TICKER_DIR):
+            target = os.path.abspath(os.path.join(real_dir, name))
+            shutil.copyfile(os.path.join(TICKER_DIR, name), target)
+            datasets.append((name.replace('.csv', ''), target, real_ftd_dir))
+
+    synthetic_dir = os.path.join(data_dir, 'synthetic')
+    os.makedirs(synthetic_dir, exist_ok=True)
+    for rows in sizes:
+        ticker = os.path.join(synthetic_dir, f'SYN{rows}.csv')
+        ftd_dir = os.path.join(synthetic_dir, f'ftd-{rows}')
+        ftd = os.path.join(ftd_dir, f'cnsfailsSYN{rows}.txt')
+        if not (os.path.exists(ticker) and os.path.exists(ftd)):
+            print(f'generating {rows} rows', file=sys.stderr, flush=True)
+            os.makedirs(ftd_dir, exist_ok=True)
+            dates, prices = write_synthetic_ticker(ticker, rows)
+            write_synthetic_ftd(ftd, f'SYN{rows}', dates, prices)
+        datasets.append((f'synthetic-{rows}', os.path.abspath(ticker), os.path.abspath(ftd_dir)))
+    return datasets
+
+
+def measure(fn, repeat, setup=None, warmup=True):
+    # Wall time of repeat calls to fn, with setup run untimed before each and
+    # one untimed call first so lazy imports and caches don't skew the first run
+    times, result = [], None
+    if warmup:
+        fn()
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return result, {'min': min(times), 'median': statistics.median(times), 'mean': statistics.fmean(times), 'repeat': repeat}
+
+
+def format_seconds(seconds):
+    if seconds < 1e-3:
+        return f'{seconds * 1e6:>10.2f} us'
+    return f'{seconds * 1e3:>10.2f} ms'
+
+
+def remove_stored_columns(csv_path):
+    for target in [sidecar_path(csv_path)] + [level_path(csv_path, level) for level in LEVELS + INTRADAY_LEVELS]:
+        shutil.rmtree(target, ignore_errors=True)
+
+
+def benchmark_dataset(name, csv_path, ftd_dir, repeat):
+    from utils import (
+        calculate_best_fit, get_ticker_data, load_and_standardize_data, load_ftd_data,
+        select_overlay_data, ticker_cache, ticker_symbol, update_graph
+    )
+
+    results = []
+
+    def record(benchmark, stats, **extra):
+        results.append(dict(dataset=name, benchmark=benchmark, **stats, **extra))
+        print(f"{name:<20} {benchmark:<26} {format_seconds(stats['median'])}", file=sys.stderr, flush=True)
+
+    # Cold: parse the CSV and write the sidecar and pyramid. Warm: memory-map them
+    _, stats = measure(lambda: load_and_standardize_data(csv_path), repeat, setup=lambda: remove_stored_columns(csv_path), warmup=False)
+    df, warm = measure(lambda: load_and_standardize_data(csv_path), repeat)
+    rows = len(df)
+    record('load_cold', stats, rows=rows)
+    record('load_warm', warm, rows=rows)
+
+    ticker_cache.invalidate(csv_path)
+    ticker = get_ticker_data(csv_path)
+    # Building the FTD store from every file, then one ticker's slice of it
+    ftd_store, stats = measure(lambda: ingest_ftd(ftd_dir, force=True)[1], repeat, warmup=False)
+    record('ingest_ftd', stats, rows=len(ftd_store))
+    ftd_df, stats = measure(lambda: load_ftd_data(ftd_store, ticker_symbol(csv_path)), repeat)
+    record('load_ftd', stats, rows=len(ftd_df))
+
+    # Figure construction and the JSON Dash would send, with FTDs shown
+    def build():
+        return update_graph(
+            ticker.df, ftd_df, csv_path, 'no', None, None, None, None,
+            0, 1, 1, 0, 0, ['volume', 'open_price', 'ftd'], None
+        )
+    figure, stats = measure(build, repeat)
+    record('update_graph', stats, rows=rows)
+    payload, stats = measure(lambda: pio.to_json(figure, validate=False), repeat)
+    record('update_graph_json', stats, rows=rows, json_bytes=len(payload))
+
+    overlay = select_overlay_data(ticker.df, 'no', None, None)
+    # The best fit's objective: one candidate per call, then many per call
+    overlay_dates = overlay['Date'].to_numpy().astype('datetime64[s]').astype(np.int64)
+    problem = FitProblem(overlay_dates, overlay['Open'].to_numpy(dtype=float), ticker.dates, ticker.open)
+    move, x_scale = np.array([-365.0]), np.array([1.0])
+    _, stats = measure(lambda: [problem.solve(move, x_scale) for _ in range(FIT_CALLS)], repeat)
+    record('fit_evaluation', {key: value / FIT_CALLS if key != 'repeat' else value for key, value in stats.items()},
+           rows=rows, overlay_rows=len(overlay), unit='per evaluation')
+
+    rng = np.random.default_rng(0)
+    moves = rng.uniform(-1500, -100, SOLVE_CANDIDATES)
+    x_scales = rng.uniform(0.5, 2.0, SOLVE_CANDIDATES)
+    _, stats = measure(lambda: problem.solve(moves, x_scales), repeat)
+    record('fit_solve', {key: value / SOLVE_CANDIDATES if key != 'repeat' else value for key, value in stats.items()},
+           rows=rows, overlay_rows=len(overlay), unit='per evaluation')
+
+    # Every indicator over the whole history, then extended past a revised last row
+    columns = input_columns(ticker.df)
+    _, stats = measure(lambda: [compute(series, columns) for series in INDICATORS], repeat)
+    record('indicators_full', stats, rows=rows)
+    values = {series: compute(series, columns) for series in INDICATORS}
+    _, stats = measure(lambda: [extend(series, values[series], columns, rows - 1) for series in INDICATORS], repeat)
+    record('indicators_extend', stats, rows=rows)
+
+    fit, stats = measure(lambda: calculate_best_fit(csv_path, 1, 0, 1, 1, 0, 0, 'no', None, None), repeat)
+    record('calculate_best_fit', stats, rows=rows, overlay_rows=len(overlay), fit=[float(v) for v in fit])
+    ticker_cache.invalidate(csv_path)
+    return results
+
+
+def benchmark_startup(repeat):
+    # import app, create_app() and the first page load, each against its budget
+    here = os.path.dirname(os.path.abspath(__file__))
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT], cwd=here, capture_output=True, text=True, check=True).stdout
+        runs.append(json.loads(output.splitlines()[-1]))
+
+    results = []
+    for step, budget in STARTUP_BUDGET.items():
+        times = [run[step] for run in runs]
+        median = statistics.median(times)
+        results.append({
+            'dataset': 'startup', 'benchmark': step, 'min': min(times), 'median': median,
+            'mean': statistics.fmean(times), 'repeat': repeat, 'budget': budget, 'over_budget': median > budget,
+        })
+        flag = '  OVER BUDGET' if median > budget else ''
+        print(f"{'startup':<20} {step:<26} {format_seconds(median)}  (budget {budget * 1e3:.0f} ms){flag}", file=sys.stderr, flush=True)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(previous, current):
+    # Median ratio per (dataset, benchmark) present in both runs; > 1 is slower
+    old = {(r['dataset'], r['benchmark']): r for r in previous['results']}
+    print(f"{'dataset':<20} {'benchmark':<26} {'before':>13} {'after':>13} {'ratio':>7}")
+    for row in current['results']:
+        before = old.get((row['dataset'], row['benchmark']))
+        if before is None or before['median'] == 0:
+            continue
+        print(f"{row['dataset']:<20} {row['benchmark']:<26} {format_seconds(before['median'])} "
+              f"{format_seconds(row['median'])} {row['median'] / before['median']:>7.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time app startup and the data loading, chart and fit paths on real and synthetic histories.')
+    parser.add_argument('--sizes', type=int, nargs='*', default=list(DEFAULT_SIZES), help='synthetic history sizes in rows (default: %(default)s)')
+    parser.add_argument('--no-real', action='store_true', help='skip the CSVs in the ticker directory')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per benchmark (default: %(default)s)')
+    parser.add_argument('--data-dir', default='.benchmark/data', help='where generated datasets are kept (default: %(default)s)')
+    parser.add_argument('--output', default=None, help='results file (default: .benchmark/results-<commit>.json)')
+    parser.add_argument('--compare', default=None, help='earlier results file to print median ratios against')
+    parser.add_argument('--startup-only', action='store_true', help='only time app import, create_app() and the first request')
+    parser.add_argument('--check-budget', action='store_true', help='exit with status 1 when a startup step is over its budget')
+    args = parser.parse_args(argv)
+
+    commit = git_commit()
+    results = benchmark_startup(args.repeat)
+    if not args.startup_only:
+        for name, csv_path, ftd_dir in prepare_datasets(args.data_dir, args.sizes, not args.no_real):
+            results.extend(benchmark_dataset(name, csv_path, ftd_dir, args.repeat))
+
+    report = {
+        'commit': commit,
+        'timestamp': pd.Timestamp.now(tz='UTC').isoformat(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'results': results,
+    }
+    output = args.output or os.path.join('.benchmark', f"results-{commit or 'unknown'}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'wrote {output}', file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+    if args.check_budget and any(row.get('over_budget') for row in results):
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
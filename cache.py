@@ -0,0 +1,100 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from pyramid import is_intraday, levels_for, load_level
+
+# Default memory budget for parsed ticker histories, overridable per process
+DEFAULT_BUDGET_MB = float(os.environ.get('TICKER_CACHE_MB', 256))
+
+
+# A parsed, date-sorted ticker history plus the arrays the hot paths need
+class TickerData:
+    def __init__(self, path, mtime, df):
+        self.path = path
+        self.mtime = mtime
+        self.df = df
+        # Epoch seconds regardless of the datetime resolution pandas picked
+        self.dates = df['Date'].to_numpy().astype('datetime64[s]').astype(np.int64)
+        self.open = df['Open'].to_numpy(dtype=float)
+        self.volume = df['Volume'].to_numpy(dtype=float)
+        self.intraday = is_intraday(self.dates)
+        self.levels = levels_for(self.dates)
+        self.nbytes = int(df.memory_usage(index=True, deep=True).sum()
+                          + self.dates.nbytes + self.open.nbytes + self.volume.nbytes)
+        self._levels = {}
+
+    def level(self, name):
+        # Weekly/monthly/quarterly bars as TickerData, loaded on first use
+        if name not in self._levels:
+            self._levels[name] = TickerData(self.path, self.mtime, load_level(self.path, name, self.df))
+        return self._levels[name]
+
+    def level_for(self, start, end, n_points):
+        # Coarsest level that still has n_points rows between two epoch-second
+        # dates, falling back to the stored rows
+        for name in self.levels:
+            level = self.level(name)
+            first, last = np.searchsorted(level.dates, [start, end], 'left')
+            if last - first >= n_points:
+                return level
+        return self
+
+
+# Process-wide LRU of TickerData keyed by path and file mtime
+class TickerCache:
+    def __init__(self, loader, budget_mb=DEFAULT_BUDGET_MB):
+        self.loader = loader
+        self.budget_bytes = int(budget_mb * 1024 * 1024)
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        key = os.path.abspath(path)
+        mtime = os.stat(key).st_mtime_ns
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.mtime == mtime:
+                self._entries.move_to_end(key)
+                return entry
+
+        # Parse outside the lock so one slow file doesn't stall other tickers
+        entry = TickerData(key, mtime, self.loader(key))
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= old.nbytes
+            self._entries[key] = entry
+            self._size += entry.nbytes
+            self._evict()
+        return entry
+
+    def invalidate(self, path=None):
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+                self._size = 0
+                return
+            old = self._entries.pop(os.path.abspath(path), None)
+            if old is not None:
+                self._size -= old.nbytes
+
+    def set_budget(self, budget_mb):
+        with self._lock:
+            self.budget_bytes = int(budget_mb * 1024 * 1024)
+            self._evict()
+
+    def _evict(self):
+        # Always keep the most recently used entry, even if it alone is over budget
+        while self._size > self.budget_bytes and len(self._entries) > 1:
+            _, old = self._entries.popitem(last=False)
+            self._size -= old.nbytes
+
+    def __contains__(self, path):
+        return os.path.abspath(path) in self._entries
+
+    def __len__(self):
+        return len(self._entries)
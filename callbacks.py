@@ -1,8 +1,40 @@
-from dash import Input, Output, State, callback_context
-from utils import update_graph, calculate_best_fit
+from dash import ALL, Input, Output, State, ClientsideFunction, Patch, callback_context, html, no_update
+from indicators import DEFAULT_SERIES
+from utils import (
+    update_graph, calculate_best_fit, scan_history, search_all_tickers, get_ticker_data, overlay_store_data, select_overlay_data,
+    get_ftd_data, list_ticker_files, ticker_mtime, ticker_options, series_frame,
+    default_ranges, historic_frame, build_historic_traces, build_overlay_traces, build_ftd_trace,
+    HISTORIC_TRACE, OVERLAY_TRACE, VOLUME_TRACE, OVERLAY_VOLUME_TRACE, FTD_TRACE
+)
+import math
 import pandas as pd
 
-def register_callbacks(app, df, ftd_df, three_months_data):
+# Inputs that only change trace styling or visibility, never the underlying data
+COSMETIC_INPUTS = {'static-chart-color', 'overlay-color', 'ftd-lines-color', 'trace-toggle'}
+# Inputs that only change which rows the historic or overlay traces cover
+RANGE_INPUTS = {'date-range-toggle', 'date-picker-range', 'historic-picker-range'}
+
+def picker_range(df, use_date_range, start_date, end_date, five_year_start, five_year_end):
+    if use_date_range == 'yes' and start_date and end_date:
+        return [start_date, end_date]
+    elif five_year_start and five_year_end:
+        return [five_year_start, five_year_end]
+    return [df['Date'].min(), df['Date'].max()]
+
+def zoomed_range(relayoutData):
+    # The x range a zoom, pan or range slider drag settled on; 'autorange' for a
+    # reset, None for relayout events that don't move the x axis
+    if not relayoutData:
+        return None
+    if 'xaxis.range[0]' in relayoutData:
+        return [relayoutData['xaxis.range[0]'], relayoutData['xaxis.range[1]']]
+    if 'xaxis.range' in relayoutData:
+        return list(relayoutData['xaxis.range'])
+    if relayoutData.get('xaxis.autorange'):
+        return 'autorange'
+    return None
+
+def register_callbacks(app):
     @app.callback(
         [
             Output('date-picker-range', 'start_date'),
@@ -10,6 +42,7 @@ def register_callbacks(app, df, ftd_df, three_months_data):
             Output('historic-picker-range', 'start_date'),
             Output('historic-picker-range', 'end_date'),
             Output('stock-graph', 'figure'),
+            Output('overlay-store', 'data'),
         ],
         [
             Input('csv-dropdown', 'value'),
@@ -18,22 +51,27 @@ def register_callbacks(app, df, ftd_df, three_months_data):
             Input('date-picker-range', 'end_date'),
             Input('historic-picker-range', 'start_date'),
             Input('historic-picker-range', 'end_date'),
-            Input('x-offset-slider', 'value'),
-            Input('y-scale-slider', 'value'),
-            Input('x-scale-slider', 'value'),
-            Input('y-offset-slider', 'value'),
-            Input('log-scale-slider', 'value'),
             Input('trace-toggle', 'value'),
             Input('static-chart-color', 'value'),
             Input('overlay-color', 'value'),
             Input('ftd-lines-color', 'value'),
-            State('stock-graph', 'relayoutData')
+            Input('ftd-threshold', 'value'),
+            Input('series-dropdown', 'value'),
+            # Zooming swaps in full-resolution points for the visible window
+            Input('stock-graph', 'relayoutData'),
+            # Slider drags are applied in the browser by overlay.transform below;
+            # the server only needs their current values when it rebuilds the figure
+            State('x-offset-slider', 'value'),
+            State('y-scale-slider', 'value'),
+            State('x-scale-slider', 'value'),
+            State('y-offset-slider', 'value'),
+            State('log-scale-slider', 'value')
         ]
     )
-    def update_graph_callback(csv_file, use_date_range, start_date, end_date, five_year_start, five_year_end, x_offset, y_scale, x_scale, y_offset, log_scale, trace_toggle, static_chart_color, overlay_color, ftd_lines_color, relayoutData):
-        # Get the context to identify which input triggered the callback
+    def update_graph_callback(csv_file, use_date_range, start_date, end_date, five_year_start, five_year_end, trace_toggle, static_chart_color, overlay_color, ftd_lines_color, ftd_threshold, series, relayoutData, x_offset, y_scale, x_scale, y_offset, log_scale):
+        # Get the context to identify which inputs triggered the callback
         ctx = callback_context
-        trigger = ctx.triggered[0]['prop_id'].split('.')[0]
+        triggered = set(ctx.triggered_prop_ids.values())
 
         # Update the graph if csv file is changed or color pickers are used
         if csv_file is None:
@@ -50,32 +88,133 @@ def register_callbacks(app, df, ftd_df, three_months_data):
                     'height': 550,
                     'xaxis_rangeslider': {'visible': True}
                 }
-            }
-
-        # Check if color picker triggered the callback
-        if trigger in ['static-chart-color', 'overlay-color', 'ftd-lines-color']:
-            figure = update_graph(
-                df, ftd_df, csv_file, use_date_range, start_date, end_date,
-                five_year_start, five_year_end, x_offset, y_scale, x_scale,
-                y_offset, log_scale, trace_toggle, relayoutData,
-                static_chart_color['hex'], overlay_color['hex'], ftd_lines_color['hex']
+            }, None
+
+        # The selected ticker's fails, memoized per FTD store version and threshold
+        ftd_df = get_ftd_data(csv_file, ftd_threshold)
+        # Pages loaded before the series dropdown existed send None
+        series = series or DEFAULT_SERIES
+
+        # Cosmetic changes only touch trace properties, so send a Patch instead of the figure
+        if triggered and triggered <= COSMETIC_INPUTS:
+            patched = Patch()
+            if 'static-chart-color' in triggered:
+                patched['data'][HISTORIC_TRACE]['line']['color'] = static_chart_color['hex']
+            if 'overlay-color' in triggered:
+                patched['data'][OVERLAY_TRACE]['line']['color'] = overlay_color['hex']
+            if 'ftd-lines-color' in triggered:
+                patched['data'][FTD_TRACE]['line']['color'] = ftd_lines_color['hex']
+            if 'trace-toggle' in triggered:
+                for index in (HISTORIC_TRACE, OVERLAY_TRACE):
+                    patched['data'][index]['visible'] = 'open_price' in trace_toggle
+                for index in (VOLUME_TRACE, OVERLAY_VOLUME_TRACE):
+                    patched['data'][index]['visible'] = 'volume' in trace_toggle
+                if 'ftd' in trace_toggle:
+                    # The FTD trace is only built while shown, so build it on the way in
+                    ticker_df = get_ticker_data(csv_file).df
+                    patched['data'][FTD_TRACE] = build_ftd_trace(
+                        ftd_df, trace_toggle, ftd_lines_color['hex'],
+                        picker_range(ticker_df, use_date_range, start_date, end_date, five_year_start, five_year_end)
+                    )
+                else:
+                    patched['data'][FTD_TRACE]['visible'] = False
+            return no_update, no_update, no_update, no_update, patched, no_update
+
+        # The threshold only changes which fails the FTD trace shows
+        if triggered == {'ftd-threshold'}:
+            if 'ftd' not in trace_toggle:
+                return no_update, no_update, no_update, no_update, no_update, no_update
+            patched = Patch()
+            patched['data'][FTD_TRACE] = build_ftd_trace(
+                ftd_df, trace_toggle, ftd_lines_color['hex'],
+                picker_range(get_ticker_data(csv_file).df, use_date_range, start_date, end_date, five_year_start, five_year_end)
+            )
+            return no_update, no_update, no_update, no_update, patched, no_update
+
+        # Rows plus the selected price series or indicator, memoized per ticker version
+        ticker_df = series_frame(get_ticker_data(csv_file), series)
+        xaxis_range = picker_range(ticker_df, use_date_range, start_date, end_date, five_year_start, five_year_end)
+
+        # Zooming re-fetches the historic traces at full resolution for the new
+        # window only, and re-clips the FTD trace to it
+        if triggered == {'stock-graph'}:
+            view = zoomed_range(relayoutData)
+            if view is None:
+                return no_update, no_update, no_update, no_update, no_update, no_update
+            patched = Patch()
+            _, _, historic_start, historic_end = default_ranges(
+                ticker_df, start_date, end_date, five_year_start, five_year_end
+            )
+            if view == 'autorange':
+                view = None
+                patched['layout']['xaxis']['autorange'] = True
+            else:
+                patched['layout']['xaxis']['range'] = view
+            for axis in ('yaxis', 'yaxis2'):
+                if f'{axis}.range[0]' in relayoutData:
+                    patched['layout'][axis]['range'] = [relayoutData[f'{axis}.range[0]'], relayoutData[f'{axis}.range[1]']]
+            trace_five_year, volume_five_year = build_historic_traces(
+                *historic_frame(csv_file, view or [historic_start, historic_end], series),
+                historic_start, historic_end, trace_toggle, static_chart_color['hex'], view, series
+            )
+            patched['data'][HISTORIC_TRACE] = trace_five_year
+            patched['data'][VOLUME_TRACE] = volume_five_year
+            if 'ftd' in trace_toggle:
+                patched['data'][FTD_TRACE] = build_ftd_trace(ftd_df, trace_toggle, ftd_lines_color['hex'], view or xaxis_range)
+            return no_update, no_update, no_update, no_update, patched, no_update
+
+        # A date picker only invalidates the historic traces and, for the overlay
+        # picker, the overlay pair
+        if triggered and triggered <= RANGE_INPUTS:
+            patched = Patch()
+            overlay_store = no_update
+            range_start, range_end, historic_start, historic_end = default_ranges(
+                ticker_df, start_date, end_date, five_year_start, five_year_end
+            )
+            # Either picker can move the visible window, which the historic LOD depends on
+            trace_five_year, volume_five_year = build_historic_traces(
+                *historic_frame(csv_file, xaxis_range, series), historic_start, historic_end,
+                trace_toggle, static_chart_color['hex'], xaxis_range, series
             )
-            return start_date, end_date, five_year_start, five_year_end, figure
+            patched['data'][HISTORIC_TRACE] = trace_five_year
+            patched['data'][VOLUME_TRACE] = volume_five_year
+            if triggered & {'date-range-toggle', 'date-picker-range'}:
+                trace_overlay, volume_overlay = build_overlay_traces(
+                    ticker_df, use_date_range, range_start, range_end, x_offset, y_scale, x_scale,
+                    y_offset, log_scale, trace_toggle, overlay_color['hex'], series
+                )
+                patched['data'][OVERLAY_TRACE] = trace_overlay
+                patched['data'][OVERLAY_VOLUME_TRACE] = volume_overlay
+                overlay_store = overlay_store_data(select_overlay_data(ticker_df, use_date_range, start_date, end_date), series)
+            if 'ftd' in trace_toggle:
+                patched['data'][FTD_TRACE] = build_ftd_trace(ftd_df, trace_toggle, ftd_lines_color['hex'], xaxis_range)
+            patched['layout']['xaxis']['range'] = xaxis_range
+            return no_update, no_update, no_update, no_update, patched, overlay_store
 
         figure = update_graph(
-            df, ftd_df, csv_file, use_date_range, start_date, end_date,
+            ticker_df, ftd_df, csv_file, use_date_range, start_date, end_date,
             five_year_start, five_year_end, x_offset, y_scale, x_scale,
-            y_offset, log_scale, trace_toggle, relayoutData
+            y_offset, log_scale, trace_toggle, relayoutData,
+            static_chart_color['hex'], overlay_color['hex'], ftd_lines_color['hex'], series
         )
+        figure['layout']['xaxis']['range'] = xaxis_range
+        overlay_store = overlay_store_data(select_overlay_data(ticker_df, use_date_range, start_date, end_date), series)
 
-        if use_date_range == 'yes' and start_date and end_date:
-            figure['layout']['xaxis']['range'] = [start_date, end_date]
-        elif five_year_start and five_year_end:
-            figure['layout']['xaxis']['range'] = [five_year_start, five_year_end]
-        else:
-            figure['layout']['xaxis']['range'] = [df['Date'].min(), df['Date'].max()]
+        return start_date, end_date, five_year_start, five_year_end, figure, overlay_store
 
-        return start_date, end_date, five_year_start, five_year_end, figure
+    app.clientside_callback(
+        ClientsideFunction(namespace='overlay', function_name='transform'),
+        Output('stock-graph', 'figure', allow_duplicate=True),
+        Input('x-offset-slider', 'value'),
+        Input('y-scale-slider', 'value'),
+        Input('x-scale-slider', 'value'),
+        Input('y-offset-slider', 'value'),
+        Input('log-scale-slider', 'value'),
+        Input('overlay-store', 'data'),
+        State('stock-graph', 'figure'),
+        State('stock-graph', 'relayoutData'),
+        prevent_initial_call=True
+    )
 
     @app.callback(
         Output('settings-modal', 'style'),
@@ -90,26 +229,31 @@ def register_callbacks(app, df, ftd_df, three_months_data):
                 return {'display': 'block'}
         return style
 
-    @app.callback(Output('x-offset-label', 'children'), [Input('x-offset-slider', 'value')])
-    def update_x_offset_label(value):
-        return f'X-Axis Offset: {value} days'
-
-    @app.callback(Output('y-scale-label', 'children'), [Input('y-scale-slider', 'value')])
-    def update_y_scale_label(value):
-        return f'Y-Axis Scale Factor: {value}'
-
-    @app.callback(Output('x-scale-label', 'children'), [Input('x-scale-slider', 'value')])
-    def update_x_scale_label(value):
-        return f'X-Axis Scale Factor: {value}'
-
-    @app.callback(Output('y-offset-label', 'children'), [Input('y-offset-slider', 'value')])
-    def update_y_offset_label(value):
-        return f'Y-Axis Offset: {value}'
-
-    @app.callback(Output('log-scale-label', 'children'), [Input('log-scale-slider', 'value')])
-    def update_log_scale_label(value):
-        return f'Open Price Logarithmic Scale Factor: {value}'
+    # Slider labels are updated in the browser so drags never hit the server
+    app.clientside_callback(
+        "function(value) { return 'X-Axis Offset: ' + value + ' days'; }",
+        Output('x-offset-label', 'children'), Input('x-offset-slider', 'value')
+    )
+    app.clientside_callback(
+        "function(value) { return 'Y-Axis Scale Factor: ' + value; }",
+        Output('y-scale-label', 'children'), Input('y-scale-slider', 'value')
+    )
+    app.clientside_callback(
+        "function(value) { return 'X-Axis Scale Factor: ' + value; }",
+        Output('x-scale-label', 'children'), Input('x-scale-slider', 'value')
+    )
+    app.clientside_callback(
+        "function(value) { return 'Y-Axis Offset: ' + value; }",
+        Output('y-offset-label', 'children'), Input('y-offset-slider', 'value')
+    )
+    app.clientside_callback(
+        "function(value) { return 'Open Price Logarithmic Scale Factor: ' + value; }",
+        Output('log-scale-label', 'children'), Input('log-scale-slider', 'value')
+    )
 
+    # Runs as a background job in its own process, so a long fit ties up no
+    # request worker and several can run at once. Each improvement is pushed
+    # through fit-partial to the sliders; cancelling keeps the best fit so far
     @app.callback(
         Output('x-offset-slider', 'value'),
         Output('y-scale-slider', 'value'),
@@ -117,6 +261,7 @@ def register_callbacks(app, df, ftd_df, three_months_data):
         Output('y-offset-slider', 'value'),
         Output('log-scale-slider', 'value'),
         Input('calculate-best-fit-button', 'n_clicks'),
+        State('csv-dropdown', 'value'),
         State('x-offset-slider', 'value'),
         State('y-scale-slider', 'value'),
         State('x-scale-slider', 'value'),
@@ -124,7 +269,174 @@ def register_callbacks(app, df, ftd_df, three_months_data):
         State('log-scale-slider', 'value'),
         State('date-range-toggle', 'value'),
         State('date-picker-range', 'start_date'),
-        State('date-picker-range', 'end_date')
+        State('date-picker-range', 'end_date'),
+        State('series-dropdown', 'value'),
+        background=True,
+        progress=[
+            Output('fit-progress', 'value'),
+            Output('fit-progress', 'max'),
+            Output('fit-status', 'children'),
+            Output('fit-partial', 'data'),
+        ],
+        running=[
+            (Output('calculate-best-fit-button', 'disabled'), True, False),
+            (Output('cancel-best-fit-button', 'disabled'), False, True),
+        ],
+        cancel=[Input('cancel-best-fit-button', 'n_clicks')],
+        interval=250,
+        prevent_initial_call=True
+    )
+    def calculate_best_fit_callback(set_progress, n_clicks, csv_file, x_offset, y_scale, x_scale, y_offset, log_scale, use_date_range, start_date, end_date, series):
+        def report(step, steps, fit):
+            partial = [float(fit['move']), float(fit['y_scale']), float(fit['x_scale']), float(fit['y_offset'])]
+            set_progress((step, steps, f"Step {step}/{steps}: 1 - R\u00b2 {fit['score']:.4f}", partial))
+
+        set_progress((0, 1, 'Fitting...', None))
+        return calculate_best_fit(
+            csv_file, n_clicks, x_offset, y_scale, x_scale, y_offset, log_scale, use_date_range, start_date, end_date,
+            series or DEFAULT_SERIES, progress=report
+        )
+
+    app.clientside_callback(
+        """function(fit) {
+            if (!fit) { throw window.dash_clientside.PreventUpdate; }
+            return fit;
+        }""",
+        Output('x-offset-slider', 'value', allow_duplicate=True),
+        Output('y-scale-slider', 'value', allow_duplicate=True),
+        Output('x-scale-slider', 'value', allow_duplicate=True),
+        Output('y-offset-slider', 'value', allow_duplicate=True),
+        Input('fit-partial', 'data'),
+        prevent_initial_call=True
+    )
+
+    @app.callback(
+        Output('pattern-matches', 'children'),
+        Output('pattern-store', 'data'),
+        Input('scan-history-button', 'n_clicks'),
+        State('csv-dropdown', 'value'),
+        State('log-scale-slider', 'value'),
+        State('date-range-toggle', 'value'),
+        State('date-picker-range', 'start_date'),
+        State('date-picker-range', 'end_date'),
+        State('series-dropdown', 'value'),
+        prevent_initial_call=True
+    )
+    def scan_history_callback(n_clicks, csv_file, log_scale, use_date_range, start_date, end_date, series):
+        matches = scan_history(csv_file, log_scale, use_date_range, start_date, end_date, series=series or DEFAULT_SERIES)
+        if not matches:
+            return html.Div('No matching windows found.'), []
+        items = []
+        for index, match in enumerate(matches):
+            start = pd.Timestamp(match['start_date'], unit='s').strftime('%b %d, %Y')
+            end = pd.Timestamp(match['end_date'], unit='s').strftime('%b %d, %Y')
+            items.append(html.Li(html.Button(
+                f"{start} - {end} (stretch {match['stretch']:.2f}, distance {match['distance']:.3f})",
+                id={'type': 'pattern-match', 'index': index}, n_clicks=0, className='pattern-match'
+            )))
+        return html.Ol(items), matches
+
+    @app.callback(
+        Output('x-offset-slider', 'value', allow_duplicate=True),
+        Output('y-scale-slider', 'value', allow_duplicate=True),
+        Output('x-scale-slider', 'value', allow_duplicate=True),
+        Output('y-offset-slider', 'value', allow_duplicate=True),
+        Output('x-offset-slider', 'min'),
+        Output('y-scale-slider', 'max'),
+        Output('y-offset-slider', 'min'),
+        Output('y-offset-slider', 'max'),
+        Input({'type': 'pattern-match', 'index': ALL}, 'n_clicks'),
+        State('pattern-store', 'data'),
+        State('x-offset-slider', 'min'),
+        State('y-scale-slider', 'max'),
+        State('y-offset-slider', 'min'),
+        State('y-offset-slider', 'max'),
+        prevent_initial_call=True
+    )
+    def apply_pattern_match(n_clicks, matches, offset_min, scale_max, y_offset_min, y_offset_max):
+        # Freshly rendered match buttons fire with n_clicks=0; only real clicks count
+        ctx = callback_context
+        if not ctx.triggered or not ctx.triggered[0]['value'] or not matches:
+            return (no_update,) * 8
+        match = matches[ctx.triggered_id['index']]
+        # Matches can sit further back than the default 5 year slider range, and
+        # be scaled or offset past the default y ranges; widen the sliders to fit
+        def widen(limit, value, extend):
+            return extend(limit, value) if limit is not None else no_update
+        return (
+            match['move'], match['y_scale'], match['x_scale'], match['y_offset'],
+            widen(offset_min, int(match['move']) - 1, min),
+            widen(scale_max, math.ceil(match['y_scale']), max),
+            widen(y_offset_min, math.floor(match['y_offset']), min),
+            widen(y_offset_max, math.ceil(match['y_offset']), max),
+        )
+
+    def cross_ticker_table(rows):
+        header = html.Tr([html.Th(label) for label in ['Ticker', 'Start', 'End', 'Stretch', 'Distance']])
+        body = [
+            html.Tr([
+                html.Td(row['ticker'].replace('.csv', '')),
+                html.Td(pd.Timestamp(row['start_date'], unit='s').strftime('%b %d, %Y')),
+                html.Td(pd.Timestamp(row['end_date'], unit='s').strftime('%b %d, %Y')),
+                html.Td(f"{row['stretch']:.2f}"),
+                html.Td(f"{row['distance']:.3f}"),
+            ])
+            for row in rows
+        ]
+        return html.Table([html.Thead(header), html.Tbody(body)])
+
+    # A background job like the best fit, so the table fills in ticker by ticker
+    # as the search workers finish instead of after the slowest one
+    @app.callback(
+        Output('cross-ticker-results', 'children'),
+        Output('cross-ticker-status', 'children'),
+        Input('cross-ticker-button', 'n_clicks'),
+        State('csv-dropdown', 'value'),
+        State('log-scale-slider', 'value'),
+        State('date-range-toggle', 'value'),
+        State('date-picker-range', 'start_date'),
+        State('date-picker-range', 'end_date'),
+        background=True,
+        progress=[
+            Output('cross-ticker-results', 'children'),
+            Output('cross-ticker-status', 'children'),
+        ],
+        running=[(Output('cross-ticker-button', 'disabled'), True, False)],
+        interval=250,
+        prevent_initial_call=True
+    )
+    def search_all_tickers_callback(set_progress, n_clicks, csv_file, log_scale, use_date_range, start_date, end_date):
+        def report(rows, done, total):
+            set_progress((cross_ticker_table(rows), f'Searched {done}/{total} tickers'))
+
+        set_progress((no_update, 'Searching...'))
+        rows = search_all_tickers(csv_file, log_scale, use_date_range, start_date, end_date, progress=report)
+        if not rows:
+            return html.Div('No matching windows found.'), ''
+        return cross_ticker_table(rows), ''
+
+    @app.callback(
+        Output('csv-dropdown', 'options'),
+        Output('csv-dropdown', 'value'),
+        Output('drawn-ticker-mtime', 'data'),
+        Input('ticker-poll', 'n_intervals'),
+        Input('csv-dropdown', 'value'),
+        State('csv-dropdown', 'options'),
+        State('drawn-ticker-mtime', 'data'),
+        prevent_initial_call=True
     )
-    def calculate_best_fit_callback(n_clicks, x_offset, y_scale, x_scale, y_offset, log_scale, use_date_range, start_date, end_date):
-        return calculate_best_fit(df, three_months_data, n_clicks, x_offset, y_scale, x_scale, y_offset, log_scale, use_date_range, start_date, end_date)
+    def refresh_ticker_files(n_intervals, csv_file, options, drawn_mtime):
+        # Pick up CSVs dropped into or removed from the ticker directory while the
+        # server runs. Everything is compared against this page's own state, so
+        # every tab and worker sees every change. The ticker cache keys on mtime,
+        # so the next read of a refreshed file appends its new rows by itself
+        mtime = ticker_mtime(csv_file) if csv_file else None
+        if 'csv-dropdown.value' in callback_context.triggered_prop_ids:
+            # Picking a ticker draws its current file
+            return no_update, no_update, mtime
+        current = ticker_options(list_ticker_files())
+        options = current if current != options else no_update
+        # Re-selecting the shown ticker redraws the chart with its new rows
+        if mtime is not None and mtime != drawn_mtime:
+            return options, csv_file, mtime
+        return options, no_update, no_update
@@ -0,0 +1,109 @@
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from scanner import STRETCH_FACTORS, scan
+
+# Worker-side views of the packed ticker arrays, attached once per process
+_shared = {}
+
+
+def _attach(values_name, dates_name, total):
+    values_shm = shared_memory.SharedMemory(name=values_name)
+    dates_shm = shared_memory.SharedMemory(name=dates_name)
+    _shared['handles'] = (values_shm, dates_shm)
+    _shared['values'] = np.ndarray((total,), dtype=np.float64, buffer=values_shm.buf)
+    _shared['dates'] = np.ndarray((total,), dtype=np.int64, buffer=dates_shm.buf)
+
+
+def _search(name, offset, length, query, k, stretch_factors, exclude):
+    values = _shared['values'][offset:offset + length]
+    dates = _shared['dates'][offset:offset + length]
+    matches = scan(query, values, k, stretch_factors, exclude)
+    for match in matches:
+        match['start_date'] = int(dates[match['start']])
+        match['end_date'] = int(dates[match['start'] + match['length'] - 1])
+        match['distance'] = float(match['distance'])
+    return name, matches
+
+
+def iter_cross_ticker_matches(query, query_dates, tickers, source=None, k=1, stretch_factors=STRETCH_FACTORS, workers=None):
+    # Yields (name, matches) for every ticker as soon as its worker finishes.
+    # tickers is a list of (name, TickerData); all their price and date arrays
+    # are packed into two shared memory blocks so workers read them without
+    # pickling a copy per task
+    tickers = [(name, ticker) for name, ticker in tickers if len(ticker.open) >= 2]
+    if not tickers or len(query) < 2:
+        return
+    lengths = [len(ticker.open) for _, ticker in tickers]
+    offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    total = int(sum(lengths))
+
+    values_shm = shared_memory.SharedMemory(create=True, size=total * 8)
+    dates_shm = shared_memory.SharedMemory(create=True, size=total * 8)
+    try:
+        values = np.ndarray((total,), dtype=np.float64, buffer=values_shm.buf)
+        dates = np.ndarray((total,), dtype=np.int64, buffer=dates_shm.buf)
+        for (_, ticker), offset, length in zip(tickers, offsets, lengths):
+            values[offset:offset + length] = ticker.open
+            dates[offset:offset + length] = ticker.dates
+        del values, dates
+
+        query = np.asarray(query, dtype=np.float64)
+        workers = workers or min(len(tickers), os.cpu_count() or 1)
+        with ProcessPoolExecutor(workers, initializer=_attach, initargs=(values_shm.name, dates_shm.name, total)) as pool:
+            futures = []
+            for (name, ticker), offset, length in zip(tickers, offsets, lengths):
+                exclude = None
+                if name == source:
+                    # Don't let the source ticker match the overlay's own rows
+                    exclude = tuple(np.searchsorted(ticker.dates, [query_dates.min(), query_dates.max()]))
+                futures.append(pool.submit(_search, name, int(offset), length, query, k, stretch_factors, exclude))
+            for future in as_completed(futures):
+                yield future.result()
+    finally:
+        values_shm.close()
+        values_shm.unlink()
+        dates_shm.close()
+        dates_shm.unlink()
+
+
+def rank_matches(results):
+    # Best match per ticker, ordered by distance
+    rows = [dict(matches[0], ticker=name) for name, matches in results if matches]
+    return sorted(rows, key=lambda row: row['distance'])
+
+
+def main(argv=None):
+    from utils import TICKER_DIR, list_ticker_files, select_overlay_data, ticker_cache
+
+    parser = argparse.ArgumentParser(description="Rank every ticker's best match for one ticker's recent window.")
+    parser.add_argument('source', help='ticker whose last 3 months are the query, e.g. GME')
+    parser.add_argument('--dir', default=TICKER_DIR, help='ticker directory (default: %(default)s)')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: one per CPU)')
+    args = parser.parse_args(argv)
+
+    source = args.source if args.source.endswith('.csv') else args.source + '.csv'
+    overlay = select_overlay_data(ticker_cache.get(os.path.join(args.dir, source)).df, 'no', None, None)
+    query_dates = overlay['Date'].to_numpy().astype('datetime64[s]').astype(np.int64)
+    tickers = [(name, ticker_cache.get(os.path.join(args.dir, name))) for name in list_ticker_files(args.dir)]
+
+    # Print each ticker as its worker finishes, then the ranked summary
+    results = []
+    for name, matches in iter_cross_ticker_matches(overlay['Open'].to_numpy(dtype=float), query_dates, tickers, source, workers=args.workers):
+        results.append((name, matches))
+        print(f'{name}: ' + (f"distance {matches[0]['distance']:.3f}" if matches else 'no match'), flush=True)
+    print()
+    for row in rank_matches(results):
+        start = np.datetime64(row['start_date'], 's').astype('datetime64[D]')
+        end = np.datetime64(row['end_date'], 's').astype('datetime64[D]')
+        print(f"{row['ticker']:<12} {start} - {end}  stretch {row['stretch']:.2f}  distance {row['distance']:.3f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,80 @@
+import os
+
+import numpy as np
+
+# Points kept per trace for the visible range, roughly the plot's pixel width
+LOD_POINTS = int(os.environ.get('LOD_POINTS', 1500))
+# Share of LOD_POINTS spent on the parts of a trace outside the visible range,
+# which only show in the range slider
+CONTEXT_SHARE = 0.125
+
+
+def lttb(x, y, n_out):
+    # Largest-Triangle-Three-Buckets: keeps the point in each bucket that forms
+    # the largest triangle with the previous pick and the next bucket's mean,
+    # which preserves peaks and the visual shape of a line. Returns indices.
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    picked = np.empty(n_out, dtype=np.int64)
+    picked[0], picked[-1] = 0, n - 1
+
+    previous = 0
+    for bucket in range(n_out - 2):
+        lo, hi = edges[bucket], edges[bucket + 1]
+        next_lo, next_hi = hi, edges[bucket + 2] if bucket + 2 < len(edges) else n
+        mean_x = x[next_lo:next_hi].mean()
+        mean_y = y[next_lo:next_hi].mean()
+        area = np.abs(
+            (x[previous] - mean_x) * (y[lo:hi] - y[previous])
+            - (x[previous] - x[lo:hi]) * (mean_y - y[previous])
+        )
+        previous = lo + int(np.argmax(area))
+        picked[bucket + 1] = previous
+    return picked
+
+
+def minmax(y, n_out):
+    # Min and max of equal-sized buckets, so bar spikes survive downsampling.
+    # Fully vectorized by padding to a (buckets, size) matrix. Returns indices.
+    n = len(y)
+    buckets = n_out // 2
+    if n_out >= n or buckets < 1:
+        return np.arange(n)
+    size = -(-n // buckets)
+    padded = np.full(buckets * size, np.nan)
+    padded[:n] = y
+    padded = padded.reshape(buckets, size)
+    valid = ~np.all(np.isnan(padded), axis=1)
+    base = np.arange(buckets)[valid] * size
+    lows = base + np.nanargmin(padded[valid], axis=1)
+    highs = base + np.nanargmax(padded[valid], axis=1)
+    return np.unique(np.concatenate([lows, highs]))
+
+
+def lod_indices(dates, values, view=None, n_out=LOD_POINTS, method='lttb'):
+    # Full resolution inside the visible range when it fits in n_out points,
+    # downsampled to n_out otherwise, plus a coarse version of everything
+    # outside it so the range slider still shows the whole trace
+    n = len(values)
+    if n_out <= 0 or n <= n_out:
+        return np.arange(n)
+    dates = np.asarray(dates)
+    values = np.asarray(values, dtype=np.float64)
+    first, last = 0, n
+    if view is not None:
+        first = np.searchsorted(dates, view[0], 'left')
+        last = max(first, np.searchsorted(dates, view[1], 'right'))
+
+    def reduce(lo, hi, points):
+        if hi - lo <= points:
+            return np.arange(lo, hi)
+        if method == 'minmax':
+            return lo + minmax(values[lo:hi], points)
+        return lo + lttb(dates[lo:hi].astype('datetime64[s]').astype(np.int64), values[lo:hi], points)
+
+    context = max(2, int(n_out * CONTEXT_SHARE))
+    return np.concatenate([reduce(0, first, context), reduce(first, last, n_out), reduce(last, n, context)])
@@ -0,0 +1,189 @@
+import numpy as np
+
+DAY = 86400.0
+
+# Search range: the x-offset slider's default range, and the part of the
+# x-scale slider's 0-10 where a stretched window is still worth matching
+MOVE_BOUNDS = (-5 * 365, 5 * 365)
+X_SCALE_BOUNDS = (0.25, 4.0)
+# y-scale and y-offset slider limits, which layout.py reads; the best fit
+# keeps inside them so the slider handles can show it
+Y_SCALE_BOUNDS = (0.0, 10.0)
+Y_OFFSET_BOUNDS = (-200.0, 50.0)
+
+# Candidate windows scored per vectorized pass, sized to keep batches in cache
+BATCH_POINTS = 1 << 20
+# Overlay rows a coarser pyramid level must still have to stand in for the
+# daily bars while screening the grid
+COARSE_POINTS = 60
+# Shrinking patch rounds run around each screened candidate
+REFINE_ROUNDS = 16
+
+
+# Least-squares fit of an overlay window against a reference series.
+#
+# For a given (move, x_scale) the best y_scale and y_offset have a closed form,
+# so the search only has to explore two dimensions, and every candidate's
+# objective is one vectorized interp plus a few reductions over precomputed arrays.
+# Candidates are ranked by residual / target variance (1 - R^2) rather than raw
+# squared error, which would otherwise favour flat stretches with y_scale near 0.
+class FitProblem:
+    def __init__(self, overlay_dates, overlay_values, ref_dates, ref_values, log_scale=0.0, exclude=None, y_bounds=True):
+        overlay_dates = np.asarray(overlay_dates, dtype=np.float64)
+        overlay_values = np.asarray(overlay_values, dtype=np.float64)
+        self.log_scale = float(log_scale)
+        self.start = overlay_dates.min()
+        self.offsets = overlay_dates - self.start
+        self.span = self.offsets.max()
+
+        values = np.log(overlay_values) * self.log_scale if self.log_scale > 0 else overlay_values
+        self.values_mean = values.mean()
+        self.values_centered = values - self.values_mean
+        self.values_ss = float(np.dot(self.values_centered, self.values_centered))
+
+        self.ref_dates = np.asarray(ref_dates, dtype=np.float64)
+        self.ref_values = np.asarray(ref_values, dtype=np.float64)
+        # Dates (epoch seconds) the moved window may not overlap, normally the
+        # overlay's own dates, which would otherwise always be a perfect match
+        self.exclude = exclude
+        # Clamp y_scale to Y_SCALE_BOUNDS and rule out y_offsets outside
+        # Y_OFFSET_BOUNDS. Without it a negative scale is still clamped to 0
+        self.y_bounds = y_bounds
+
+    def valid(self, moves, x_scales):
+        first = self.start + moves * DAY
+        last = first + self.span * x_scales
+        ok = (x_scales >= X_SCALE_BOUNDS[0]) & (x_scales <= X_SCALE_BOUNDS[1]) & (first >= self.ref_dates[0]) & (last <= self.ref_dates[-1])
+        ok &= (moves >= MOVE_BOUNDS[0]) & (moves <= MOVE_BOUNDS[1])
+        if self.exclude is not None:
+            ok &= (last < self.exclude[0]) | (first > self.exclude[1])
+        return ok
+
+    def solve(self, moves, x_scales):
+        moves = np.asarray(moves, dtype=np.float64)
+        x_scales = np.asarray(x_scales, dtype=np.float64)
+        score = np.full(moves.shape, np.inf)
+        y_scale = np.zeros(moves.shape)
+        y_offset = np.zeros(moves.shape)
+
+        batch = max(1, BATCH_POINTS // max(1, len(self.offsets)))
+        for lo in range(0, len(moves), batch):
+            hi = lo + batch
+            query = (self.start + moves[lo:hi, None] * DAY) + self.offsets[None, :] * x_scales[lo:hi, None]
+            target = np.interp(query, self.ref_dates, self.ref_values)
+            target_mean = target.mean(axis=1)
+            target -= target_mean[:, None]
+            cov = target @ self.values_centered
+            target_ss = np.einsum('ij,ij->i', target, target)
+
+            scale = cov / self.values_ss if self.values_ss > 0 else np.zeros_like(cov)
+            # A negative scale would mirror the overlay, which the sliders can't
+            # express. The closed form offset below is the best one for any
+            # scale, so the clamped scale's sse is still exact
+            scale = np.clip(scale, *Y_SCALE_BOUNDS) if self.y_bounds else np.maximum(scale, 0.0)
+            sse = target_ss - 2 * scale * cov + scale ** 2 * self.values_ss
+            with np.errstate(divide='ignore', invalid='ignore'):
+                score[lo:hi] = np.where(target_ss > 0, sse / target_ss, np.inf)
+            y_scale[lo:hi] = scale
+            y_offset[lo:hi] = target_mean - scale * self.values_mean
+
+        score[~self.valid(moves, x_scales)] = np.inf
+        if self.y_bounds:
+            score[(y_offset < Y_OFFSET_BOUNDS[0]) | (y_offset > Y_OFFSET_BOUNDS[1])] = np.inf
+        return score, y_scale, y_offset
+
+    def grid(self, move_step=None, scales=33):
+        span_days = self.span / DAY
+        if move_step is None:
+            move_step = max(1.0, span_days / 90)
+        lo = max(MOVE_BOUNDS[0], (self.ref_dates[0] - self.start) / DAY)
+        hi = min(MOVE_BOUNDS[1], (self.ref_dates[-1] - self.start) / DAY)
+        moves = np.arange(np.floor(lo), np.ceil(hi) + move_step, move_step)
+        x_scales = np.geomspace(X_SCALE_BOUNDS[0], X_SCALE_BOUNDS[1], scales)
+        moves, x_scales = np.meshgrid(moves, x_scales, indexing='ij')
+        return moves.ravel(), x_scales.ravel(), move_step, x_scales[0, 1] / x_scales[0, 0]
+
+
+def pick_distinct(moves, score, k, min_gap):
+    # Greedy best-first pick that skips candidates within min_gap days of a chosen
+    # one, so the top-k are separate basins rather than neighbours of the best
+    chosen = []
+    for index in np.argsort(score):
+        if not np.isfinite(score[index]) or len(chosen) == k:
+            break
+        if all(abs(moves[index] - moves[other]) >= min_gap for other in chosen):
+            chosen.append(index)
+    return np.array(chosen, dtype=int)
+
+
+def fit_row(moves, x_scales, score, y_scale, y_offset, i):
+    return {'move': moves[i], 'x_scale': x_scales[i], 'y_scale': y_scale[i], 'y_offset': y_offset[i], 'score': score[i]}
+
+
+def refine(problem, moves, x_scales, move_step, scale_ratio, rounds=REFINE_ROUNDS, points=9, shrink=0.7, progress=None):
+    # Shrinking local grid run on all seeds at once: each round scores a
+    # points x points patch around every seed in a single solve() call, then
+    # recentres on the best point and shrinks the patch. A patch is sturdier than
+    # a pattern search here, as interpolating daily bars makes the objective kinked.
+    # Patches include their centre, so the best fit after each round, passed to
+    # progress(round, fit), never gets worse
+    moves = np.array(moves, dtype=np.float64)
+    x_scales = np.array(x_scales, dtype=np.float64)
+    move_radius = 2.0 * move_step
+    scale_radius = 2.0 * np.log(scale_ratio)
+    unit = np.linspace(-1.0, 1.0, points)
+    move_delta, scale_delta = (a.ravel() for a in np.meshgrid(unit, unit, indexing='ij'))
+    rows = np.arange(len(moves))
+
+    for done in range(1, rounds + 1):
+        candidate_moves = moves[:, None] + move_delta[None, :] * move_radius
+        candidate_scales = x_scales[:, None] * np.exp(scale_delta[None, :] * scale_radius)
+        score, y_scale, y_offset = problem.solve(candidate_moves.ravel(), candidate_scales.ravel())
+        best = np.argmin(score.reshape(len(moves), len(move_delta)), axis=1)
+        moves = candidate_moves[rows, best]
+        x_scales = candidate_scales[rows, best]
+        move_radius *= shrink
+        scale_radius *= shrink
+        if progress is not None:
+            i = int(np.argmin(score))
+            if np.isfinite(score[i]):
+                progress(done, fit_row(candidate_moves.ravel(), candidate_scales.ravel(), score, y_scale, y_offset, i))
+    return moves, x_scales
+
+
+def best_fit(problem, seeds=(), top_k=32, coarse=None, progress=None):
+    # coarse is an optional FitProblem over weekly/monthly bars of the same
+    # series; it screens the grid, and only the refine runs on the daily bars.
+    # progress, if given, is called as progress(step, steps, fit) with the best
+    # fit so far after the screen and after each refine round
+    steps = REFINE_ROUNDS + 1
+    screen = coarse or problem
+    moves, x_scales, move_step, scale_ratio = screen.grid()
+    if len(seeds):
+        seeds = np.asarray(seeds, dtype=np.float64).reshape(-1, 2)
+        moves = np.concatenate([moves, seeds[:, 0]])
+        x_scales = np.concatenate([x_scales, seeds[:, 1]])
+    score, _, _ = screen.solve(moves, x_scales)
+
+    chosen = pick_distinct(moves, score, top_k, min_gap=max(move_step, problem.span / DAY / 8))
+    if len(chosen) == 0:
+        return None
+    moves, x_scales = moves[chosen], x_scales[chosen]
+    if coarse is not None:
+        # The coarse overlay starts at its first bar, not the first day; restate
+        # each window in the daily problem's terms and let the refine search
+        # one coarse bar either side
+        moves = moves + (coarse.start - problem.start) * (1.0 - x_scales) / DAY
+        move_step = max(move_step, np.median(np.diff(coarse.ref_dates)) / DAY)
+    if progress is not None:
+        score, y_scale, y_offset = problem.solve(moves, x_scales)
+        i = int(np.argmin(score))
+        if np.isfinite(score[i]):
+            progress(1, steps, fit_row(moves, x_scales, score, y_scale, y_offset, i))
+    moves, x_scales = refine(
+        problem, moves, x_scales, move_step, scale_ratio,
+        progress=None if progress is None else lambda done, fit: progress(1 + done, steps, fit)
+    )
+    score, y_scale, y_offset = problem.solve(moves, x_scales)
+    order = np.argsort(score)
+    return [fit_row(moves, x_scales, score, y_scale, y_offset, i) for i in order if np.isfinite(score[i])]
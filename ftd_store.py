@@ -0,0 +1,190 @@
+import argparse
+import os
+import shutil
+import sys
+
+import numpy as np
+import pandas as pd
+
+from store import SIDECAR_DIR, load_columns, read_manifest, write_columns
+
+# Directory of fails-to-deliver files: the SEC's semi-monthly cnsfails files
+# (pipe-delimited .txt, or the .zip they are published as) and comma-delimited
+# extracts with the same header, like GME_FTD.csv
+FTD_DIR = os.environ.get('FTD_DIR', './ftd_data')
+FTD_SUFFIXES = ('.txt', '.csv', '.zip')
+# The store lives beside them: ftd_data/.columns/FTD/<column>.npy
+STORE_NAME = 'FTD'
+# SEC header -> store column; CUSIP and the description aren't kept
+SOURCE_COLUMNS = {'SETTLEMENT DATE': 'Date', 'SYMBOL': 'Symbol', 'QUANTITY (FAILS)': 'Quantity', 'PRICE': 'Price'}
+
+
+def store_path(directory=FTD_DIR):
+    return os.path.join(os.path.abspath(directory), SIDECAR_DIR, STORE_NAME)
+
+
+def source_files(directory=FTD_DIR):
+    # FTD file name -> mtime
+    try:
+        with os.scandir(directory) as entries:
+            return {
+                e.name: e.stat().st_mtime_ns for e in entries
+                if e.is_file() and e.name.lower().endswith(FTD_SUFFIXES)
+            }
+    except FileNotFoundError:
+        return {}
+
+
+def parse_ftd_file(path):
+    # pandas unpacks a zipped file itself; the delimiter is whichever splits the header
+    sep = '|' if len(pd.read_csv(path, sep='|', nrows=0, encoding='latin-1').columns) > 1 else ','
+    df = pd.read_csv(path, sep=sep, dtype=str, encoding='latin-1', on_bad_lines='skip')
+    df = df.rename(columns=lambda name: name.strip().upper())
+    missing = [column for column in SOURCE_COLUMNS if column not in df.columns]
+    if missing:
+        raise ValueError(f'{path}: no {", ".join(missing)} column in {list(df.columns)}')
+    df = df[list(SOURCE_COLUMNS)].rename(columns=SOURCE_COLUMNS)
+
+    df['Date'] = pd.to_datetime(df['Date'].str.strip(), format='%Y%m%d', errors='coerce')
+    df['Symbol'] = df['Symbol'].str.strip().replace('', np.nan)
+    df['Quantity'] = pd.to_numeric(df['Quantity'], errors='coerce')
+    # The SEC writes '.' for an unknown price
+    df['Price'] = pd.to_numeric(df['Price'], errors='coerce')
+    # Drops the "Trailer record count" lines at the end of each file, and the
+    # odd row without a symbol
+    return df.dropna(subset=['Date', 'Symbol', 'Quantity'])
+
+
+# Every symbol's fails in one set of columns, sorted by symbol and then
+# settlement date, so one symbol's rows are a contiguous slice found by binary
+# search and a date range within them is a second one
+class FTDStore:
+    def __init__(self, symbols, columns, sources):
+        self.symbols = symbols
+        self.codes = columns['Symbol'].to_numpy()
+        self.dates = columns['Date'].to_numpy()
+        self.quantity = columns['Quantity'].to_numpy()
+        self.price = columns['Price'].to_numpy()
+        self.sources = sources
+
+    @classmethod
+    def from_rows(cls, frames, sources):
+        # Later rows win on a shared symbol and date, as a later file may revise an earlier one
+        frames = [frame for frame in frames if len(frame)]
+        if not frames:
+            frames = [pd.DataFrame({'Date': np.array([], 'datetime64[ns]'), 'Symbol': np.array([], str), 'Quantity': [], 'Price': []})]
+        df = pd.concat(frames, ignore_index=True).drop_duplicates(['Symbol', 'Date'], keep='last')
+        symbols, codes = np.unique(df['Symbol'].to_numpy(dtype=str), return_inverse=True)
+        dates = df['Date'].to_numpy().astype('datetime64[ns]')
+        order = np.lexsort((dates, codes))
+        columns = pd.DataFrame({
+            'Symbol': codes[order].astype(np.int32),
+            'Date': dates[order],
+            'Quantity': np.rint(df['Quantity'].to_numpy(dtype=np.float64)[order]).astype(np.int64),
+            'Price': df['Price'].to_numpy(dtype=np.float64)[order],
+        })
+        return cls(symbols, columns, sources)
+
+    @classmethod
+    def load(cls, target):
+        manifest = read_manifest(target)
+        return cls(np.array(manifest['symbols'], dtype=str), load_columns(target), manifest['sources'])
+
+    def write(self, target):
+        columns = pd.DataFrame({'Symbol': self.codes, 'Date': self.dates, 'Quantity': self.quantity, 'Price': self.price}, copy=False)
+        write_columns(target, columns, meta={'symbols': self.symbols.tolist(), 'sources': self.sources})
+        return self
+
+    def __len__(self):
+        return len(self.codes)
+
+    def rows(self):
+        return pd.DataFrame({
+            'Date': self.dates, 'Symbol': self.symbols[self.codes], 'Quantity': self.quantity, 'Price': self.price,
+        })
+
+    def span(self, symbol):
+        # [first, last) rows of symbol
+        code = np.searchsorted(self.symbols, symbol)
+        if code == len(self.symbols) or self.symbols[code] != symbol:
+            return 0, 0
+        return np.searchsorted(self.codes, code, 'left'), np.searchsorted(self.codes, code, 'right')
+
+    def query(self, symbol, start=None, end=None, threshold=None):
+        # Settlement date, fails and price of symbol's fails between start and
+        # end (inclusive) of more than threshold shares. The threshold is the
+        # only filter that isn't a binary search, and it only scans the slice
+        first, last = self.span(symbol)
+        dates = self.dates[first:last]
+        lo = np.searchsorted(dates, pd.Timestamp(start).to_datetime64(), 'left') if start is not None else 0
+        hi = np.searchsorted(dates, pd.Timestamp(end).to_datetime64(), 'right') if end is not None else len(dates)
+        rows = slice(first + lo, first + hi)
+        ftd_df = pd.DataFrame({
+            'SETTLEMENT DATE': self.dates[rows], 'QUANTITY (FAILS)': self.quantity[rows], 'PRICE': self.price[rows],
+        })
+        if threshold:
+            ftd_df = ftd_df[ftd_df['QUANTITY (FAILS)'].to_numpy() > threshold].reset_index(drop=True)
+        return ftd_df
+
+
+def read_ftd_files(directory, names):
+    return [parse_ftd_file(os.path.join(directory, name)) for name in names]
+
+
+def ingest_ftd(directory=FTD_DIR, force=False):
+    # Bring the store up to date with the FTD files in directory and return
+    # (status, store). New files are merged into the stored rows; a changed or
+    # deleted file, or force, rebuilds from every file
+    target, sources = store_path(directory), source_files(directory)
+    stored = None
+    if not force:
+        try:
+            stored = FTDStore.load(target)
+        except FileNotFoundError:
+            pass
+    if stored is not None and stored.sources == sources:
+        return 'up to date', stored
+
+    # cnsfailsYYYYMM[ab] names sort by date, so a later file's revisions win.
+    # Merging keeps that order only when every new file sorts after the stored
+    # ones; a file slotted in between rebuilds
+    names = sorted(sources)
+    unchanged = stored is not None and all(sources.get(name) == mtime for name, mtime in stored.sources.items())
+    added = [name for name in names if name not in stored.sources] if unchanged else []
+    if unchanged and (not stored.sources or added[0] > max(stored.sources)):
+        frames = [stored.rows()] + read_ftd_files(directory, added)
+        status = f'added {len(added)} files'
+    else:
+        frames = read_ftd_files(directory, names)
+        status = f'written from {len(names)} files'
+    return status, FTDStore.from_rows(frames, sources).write(target)
+
+
+def load_ftd_store(directory=FTD_DIR):
+    try:
+        return ingest_ftd(directory)[1]
+    except OSError:
+        # Read-only checkouts still work, they just parse the files every cold load
+        sources = source_files(directory)
+        return FTDStore.from_rows(read_ftd_files(directory, sorted(sources)), sources)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build the symbol and settlement date indexed FTD store from SEC fails-to-deliver files.')
+    parser.add_argument('files', nargs='*', help='cnsfails .txt/.zip files to copy into the FTD directory before ingesting')
+    parser.add_argument('--dir', default=FTD_DIR, help='FTD directory (default: %(default)s)')
+    parser.add_argument('--force', action='store_true', help='rebuild the store from every file instead of merging new ones')
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.dir, exist_ok=True)
+    for path in args.files:
+        target = os.path.join(args.dir, os.path.basename(path))
+        if os.path.abspath(path) != os.path.abspath(target):
+            shutil.copy2(path, target)
+    status, store = ingest_ftd(args.dir, args.force)
+    print(f'{store_path(args.dir)}: {status}, {len(store)} rows, {len(store.symbols)} symbols')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,197 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Series the overlay, historic trace and best fit can follow: key -> (label,
+# hover format). The label doubles as the series' column in chart frames
+SERIES = {
+    'open': ('Open', '.2f'),
+    'close': ('Close', '.2f'),
+    'sma20': ('20-bar mean close', '.2f'),
+    'sma50': ('50-bar mean close', '.2f'),
+    'log_return': ('Log return', '.4f'),
+    'atr14': ('14-bar ATR', '.2f'),
+    'volatility20': ('20-bar volatility', '.4f'),
+}
+DEFAULT_SERIES = 'open'
+# Series read straight from the stored price columns, which the pyramid levels also have
+RAW_SERIES = {'open', 'close'}
+# Computed series: key -> (kernel, window in bars)
+INDICATORS = {
+    'sma20': ('mean', 20),
+    'sma50': ('mean', 50),
+    'log_return': ('return', 1),
+    'atr14': ('atr', 14),
+    'volatility20': ('volatility', 20),
+}
+# Rows at the end of the previous version compared against a reloaded history.
+# A refreshed export only rewrites the last stored day and appends after it
+TAIL_ROWS = 512
+# Tickers whose indicators are memoized, least recently used dropped first
+INDICATOR_TICKERS = int(os.environ.get('INDICATOR_TICKERS', 16))
+
+
+def series_column(series):
+    return SERIES[series][0]
+
+
+def rolling_sum(values, window):
+    # Trailing window sums as differences of one cumulative sum. NaN until
+    # the window is full and wherever it covers a missing value
+    n = len(values)
+    out = np.full(n, np.nan)
+    if n < window:
+        return out
+    missing = np.isnan(values)
+    sums = np.concatenate(([0.0], np.cumsum(np.where(missing, 0.0, values))))
+    gaps = np.concatenate(([0], np.cumsum(missing)))
+    out[window - 1:] = sums[window:] - sums[:-window]
+    out[window - 1:][gaps[window:] - gaps[:-window] > 0] = np.nan
+    return out
+
+
+def rolling_mean(values, window):
+    return rolling_sum(values, window) / window
+
+
+def rolling_std(values, window):
+    # Sample standard deviation from rolling sums of x and x^2. Centring on the
+    # overall mean first keeps the subtraction from cancelling away the variance
+    if window < 2:
+        return np.full(len(values), np.nan)
+    centred = values - np.nanmean(values) if np.isfinite(values).any() else values
+    sums = rolling_sum(centred, window)
+    squares = rolling_sum(centred * centred, window)
+    variance = (squares - sums * sums / window) / (window - 1)
+    return np.sqrt(np.maximum(variance, 0.0))
+
+
+def log_returns(close):
+    out = np.full(len(close), np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out[1:] = np.diff(np.log(close))
+    out[~np.isfinite(out)] = np.nan
+    return out
+
+
+def true_range(high, low, close):
+    # Wider of the bar's own range and its gap from the previous close
+    previous = np.concatenate(([np.nan], close[:-1]))
+    ranges = np.stack([high - low, np.abs(high - previous), np.abs(low - previous)])
+    out = np.nanmax(np.where(np.isnan(ranges), -np.inf, ranges), axis=0)
+    out[np.isinf(out)] = np.nan
+    return out
+
+
+def compute(series, columns):
+    # columns holds Close, High and Low as float arrays
+    kernel, window = INDICATORS[series]
+    close = columns['Close']
+    if kernel == 'mean':
+        return rolling_mean(close, window)
+    if kernel == 'return':
+        return log_returns(close)
+    if kernel == 'atr':
+        # A simple mean of the true range; Wilder's smoothing is a recursion
+        # that no window sum can express
+        return rolling_mean(true_range(columns['High'], columns['Low'], close), window)
+    if kernel == 'volatility':
+        return rolling_std(log_returns(close), window)
+    raise ValueError(f'unknown indicator kernel {kernel!r}')
+
+
+def input_columns(df):
+    close = df['Close'].to_numpy(dtype=np.float64)
+    # Exports without High/Low still get an ATR, from close-to-close moves
+    return {
+        'Close': close,
+        'High': df['High'].to_numpy(dtype=np.float64) if 'High' in df.columns else close,
+        'Low': df['Low'].to_numpy(dtype=np.float64) if 'Low' in df.columns else close,
+    }
+
+
+def same_values(a, b):
+    return (a == b) | (np.isnan(a) & np.isnan(b))
+
+
+# Indicator values for one version of a ticker's history, plus the last rows
+# of its inputs so the next version can tell where it starts to differ
+class IndicatorSet:
+    def __init__(self, mtime, dates, columns):
+        self.mtime = mtime
+        self.rows = len(dates)
+        self.first_date = dates[0] if len(dates) else None
+        self.tail_dates = np.array(dates[-TAIL_ROWS:])
+        self.tail_columns = {name: np.array(values[-TAIL_ROWS:]) for name, values in columns.items()}
+        self.values = {}
+
+    def unchanged_rows(self, dates, columns):
+        # Leading rows of a newer history that match this version's, checked
+        # over the stored tail only; a change further back recomputes everything
+        if self.first_date is None or not len(dates) or dates[0] != self.first_date:
+            return 0
+        tail_start = self.rows - len(self.tail_dates)
+        end = min(self.rows, len(dates))
+        if end <= tail_start:
+            return 0
+        same = dates[tail_start:end] == self.tail_dates[:end - tail_start]
+        for name, values in columns.items():
+            same &= same_values(values[tail_start:end], self.tail_columns[name][:end - tail_start])
+        if same.all():
+            return end
+        first = int(np.argmin(same))
+        return tail_start + first if first > 0 else 0
+
+
+def extend(series, previous, columns, start):
+    # Recompute from row start on, reading back one window for the kernels
+    lookback = max(0, start - INDICATORS[series][1] - 1)
+    tail = compute(series, {name: values[lookback:] for name, values in columns.items()})
+    return np.concatenate([previous[:start], tail[start - lookback:]])
+
+
+# Process-wide memo of indicator values keyed by ticker path. A new version of
+# a history (a different mtime) extends the previous version's values from the
+# first changed row instead of recomputing whole windows
+class IndicatorCache:
+    def __init__(self, max_tickers=INDICATOR_TICKERS):
+        self.max_tickers = max_tickers
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, ticker, series):
+        # ticker is a TickerData of stored rows, not a pyramid level
+        with self._lock:
+            entry = self._entries.get(ticker.path)
+            if entry is not None and entry.mtime == ticker.mtime:
+                self._entries.move_to_end(ticker.path)
+                if series in entry.values:
+                    return entry.values[series]
+
+        columns = input_columns(ticker.df)
+        if entry is None or entry.mtime != ticker.mtime:
+            previous = entry
+            entry = IndicatorSet(ticker.mtime, ticker.dates, columns)
+            if previous is not None:
+                start = previous.unchanged_rows(ticker.dates, columns)
+                if start > 0:
+                    for name, values in previous.values.items():
+                        entry.values[name] = extend(name, values, columns, start)
+        if series not in entry.values:
+            entry.values[series] = compute(series, columns)
+
+        with self._lock:
+            self._entries[ticker.path] = entry
+            self._entries.move_to_end(ticker.path)
+            while len(self._entries) > self.max_tickers:
+                self._entries.popitem(last=False)
+        return entry.values[series]
+
+    def invalidate(self, path=None):
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(os.path.abspath(path), None)
@@ -0,0 +1,53 @@
+import argparse
+import os
+import sys
+
+from pyramid import update_pyramid
+from store import load_sidecar, merge_rows, parse_nasdaq_csv, read_rows_since, sidecar_is_fresh, write_sidecar
+
+
+def ingest_ticker(csv_path, force=False):
+    # Bring the ticker's sidecar and pyramid up to date with its CSV and return
+    # (status, daily rows). A refreshed export only has its rows past the
+    # stored history parsed and appended; force rebuilds from the whole CSV
+    if not force and sidecar_is_fresh(csv_path):
+        return 'up to date', load_sidecar(csv_path)
+
+    df, status = None, 'written'
+    if not force:
+        try:
+            stored = load_sidecar(csv_path)
+        except FileNotFoundError:
+            stored = None
+        if stored is not None and len(stored):
+            rows = read_rows_since(csv_path, stored['Date'].to_numpy()[-1])
+            if rows is not None:
+                df = merge_rows(stored, rows)
+                status = f'appended {len(df) - len(stored)} rows'
+    if df is None:
+        df = parse_nasdaq_csv(csv_path)
+    write_sidecar(csv_path, df)
+    update_pyramid(csv_path, df)
+    return status, df
+
+
+def main(argv=None):
+    from utils import TICKER_DIR
+
+    parser = argparse.ArgumentParser(description='Convert Nasdaq ticker CSVs into columnar .npy sidecars and weekly/monthly/quarterly bars.')
+    parser.add_argument('tickers', nargs='*', help='ticker CSV names, e.g. GME.csv (default: every CSV in the ticker directory)')
+    parser.add_argument('--dir', default=TICKER_DIR, help='ticker directory (default: %(default)s)')
+    parser.add_argument('--force', action='store_true', help='rebuild sidecars from the whole CSV instead of appending new rows')
+    args = parser.parse_args(argv)
+
+    names = args.tickers or sorted(f for f in os.listdir(args.dir) if f.endswith('.csv'))
+    for name in names:
+        if not name.endswith('.csv'):
+            name += '.csv'
+        status, _ = ingest_ticker(os.path.join(args.dir, name), args.force)
+        print(f'{name}: {status}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,319 @@
+import cProfile
+import json
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+from functools import wraps
+
+from dash import Input, Output, callback_context, dcc, html
+from flask import Response, request
+from plotly.utils import PlotlyJSONEncoder
+
+# Opt-in: with neither variable set nothing is wrapped, routed or rendered
+METRICS_ENABLED = os.environ.get('CALLBACK_METRICS', '') not in ('', '0')
+# Callbacks slower than this many milliseconds write a cProfile dump
+PROFILE_MS = float(os.environ.get('CALLBACK_PROFILE_MS', 0))
+PROFILE_DIR = os.environ.get('CALLBACK_PROFILE_DIR', './profiles')
+ENABLED = METRICS_ENABLED or PROFILE_MS > 0
+
+PHASES = ('load', 'compute', 'serialize')
+LOCAL_ADDRESSES = {'127.0.0.1', '::1', 'localhost'}
+# Disk cache key prefix of the calls background jobs queue for the server
+JOB_PREFIX = 'callback-metrics'
+
+
+# Per-callback totals. A call is split into phases: load is time spent in
+# ticker cache lookups, compute the rest of the callback body, and serialize
+# Dash's response building and JSON encoding around it
+class CallbackMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.calls = Counter()
+        self.wall = defaultdict(float)
+        self.cpu = defaultdict(float)
+        self.wall_max = defaultdict(float)
+        self.payload = Counter()
+        self.payload_max = Counter()
+        self.triggers = defaultdict(Counter)
+
+    def start(self):
+        self._local.load = [0.0, 0.0]
+        self._local.body = (0.0, 0.0)
+        self._local.triggered = ()
+
+    def add_load(self, wall, cpu):
+        load = getattr(self._local, 'load', None)
+        if load is not None:
+            load[0] += wall
+            load[1] += cpu
+
+    def end_body(self, elapsed, triggered):
+        self._local.body = elapsed
+        self._local.triggered = triggered
+
+    def finish(self, name, total, payload):
+        # total and body are (wall, cpu) pairs for the whole request and the callback body
+        self.record(name, *self.split(total), payload)
+
+    def split(self, total):
+        # (phases, wall, triggered) of the call this thread just finished
+        load, body, triggered = self._local.load, self._local.body, self._local.triggered
+        self._local.load = None
+        phases = {
+            'load': load,
+            'compute': (body[0] - load[0], body[1] - load[1]),
+            'serialize': (total[0] - body[0], total[1] - body[1]),
+        }
+        return phases, total[0], triggered
+
+    def record(self, name, phases, wall, triggered, payload):
+        with self._lock:
+            self.calls[name] += 1
+            for phase, (phase_wall, cpu) in phases.items():
+                self.wall[name, phase] += max(phase_wall, 0.0)
+                self.cpu[name, phase] += max(cpu, 0.0)
+            self.wall_max[name] = max(self.wall_max[name], wall)
+            self.payload[name] += payload
+            self.payload_max[name] = max(self.payload_max[name], payload)
+            self.triggers[name].update(triggered)
+
+    def rows(self):
+        with self._lock:
+            return [
+                {
+                    'callback': name, 'calls': calls,
+                    'wall': {phase: self.wall[name, phase] for phase in PHASES},
+                    'cpu': {phase: self.cpu[name, phase] for phase in PHASES},
+                    'wall_max': self.wall_max[name],
+                    'payload': self.payload[name], 'payload_max': self.payload_max[name],
+                    'triggers': dict(self.triggers[name]),
+                }
+                for name, calls in sorted(self.calls.items())
+            ]
+
+    def render_text(self):
+        # Prometheus text exposition format
+        lines = [
+            '# TYPE dash_callback_calls_total counter',
+            '# TYPE dash_callback_seconds_total counter',
+            '# TYPE dash_callback_wall_seconds_max gauge',
+            '# TYPE dash_callback_payload_bytes_total counter',
+            '# TYPE dash_callback_payload_bytes_max gauge',
+            '# TYPE dash_callback_triggers_total counter',
+        ]
+        for row in self.rows():
+            label = f'callback="{row["callback"]}"'
+            lines.append(f'dash_callback_calls_total{{{label}}} {row["calls"]}')
+            for clock in ('wall', 'cpu'):
+                for phase in PHASES:
+                    lines.append(f'dash_callback_seconds_total{{{label},phase="{phase}",clock="{clock}"}} {row[clock][phase]:.6f}')
+            lines.append(f'dash_callback_wall_seconds_max{{{label}}} {row["wall_max"]:.6f}')
+            lines.append(f'dash_callback_payload_bytes_total{{{label}}} {row["payload"]}')
+            lines.append(f'dash_callback_payload_bytes_max{{{label}}} {row["payload_max"]}')
+            for prop, count in sorted(row['triggers'].items()):
+                lines.append(f'dash_callback_triggers_total{{{label},input="{prop}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = CallbackMetrics()
+profile_lock = threading.Lock()
+
+
+def clocks():
+    # Wall clock, plus CPU time of this thread only, as the dev server and
+    # most WSGI servers run each request on its own thread
+    return time.perf_counter(), time.thread_time()
+
+
+def since(start):
+    wall, cpu = clocks()
+    return wall - start[0], cpu - start[1]
+
+
+def timed_body(func):
+    @wraps(func)
+    def body(*args, **kwargs):
+        start = clocks()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            metrics.end_body(since(start), list(callback_context.triggered_prop_ids))
+    return body
+
+
+def start_profile():
+    # Only one profiler can be active per process (enforced from Python
+    # 3.12), so a call that overlaps a profiled one runs unprofiled
+    if PROFILE_MS <= 0 or not profile_lock.acquire(blocking=False):
+        return None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another profiling tool, such as a debugger, is already active
+        profile_lock.release()
+        return None
+    return profiler
+
+
+def stop_profile(profiler, name, wall):
+    if profiler is None:
+        return
+    profiler.disable()
+    profile_lock.release()
+    if wall * 1000 >= PROFILE_MS:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        profiler.dump_stats(os.path.join(PROFILE_DIR, f'{name}-{stamp}-{wall * 1000:.0f}ms.prof'))
+
+
+def timed_request(name, dispatch):
+    # Wraps Dash's own per-callback dispatcher, which runs the body and then
+    # encodes the response, so the difference between the two is serialization
+    @wraps(dispatch)
+    def dispatch_timed(*args, **kwargs):
+        metrics.start()
+        profiler = start_profile()
+        response = None
+        start = clocks()
+        try:
+            response = dispatch(*args, **kwargs)
+            return response
+        finally:
+            # Also reached on PreventUpdate, which still cost a round trip
+            total = since(start)
+            stop_profile(profiler, name, total[0])
+            metrics.finish(name, total, len(response.encode()) if isinstance(response, str) else 0)
+    return dispatch_timed
+
+
+def timed_job(name, func, jobs):
+    # A background callback's body runs in its own job process, and the
+    # requests that start and poll it do no work of their own. The job times
+    # itself and queues one call on the job cache, which collect_jobs() adds to
+    # metrics. It has no serialize phase, and its CPU time is the job thread's
+    @wraps(func)
+    def job(*args, **kwargs):
+        metrics.start()
+        profiler = start_profile()
+        result = None
+        start = clocks()
+        try:
+            result = func(*args, **kwargs)
+            return result
+        finally:
+            body = since(start)
+            stop_profile(profiler, name, body[0])
+            metrics.end_body(body, list(callback_context.triggered_prop_ids))
+            phases, wall, triggered = metrics.split(body)
+            payload = len(json.dumps(result, cls=PlotlyJSONEncoder)) if result is not None else 0
+            jobs.push((name, phases, wall, triggered, payload), prefix=JOB_PREFIX)
+    return job
+
+
+def collect_jobs(jobs):
+    while True:
+        key, record = jobs.pull(prefix=JOB_PREFIX)
+        if key is None:
+            return
+        metrics.record(*record)
+
+
+def timed_cache(cache):
+    # Count ticker cache lookups, including any CSV or sidecar load they
+    # trigger, as the load phase of whichever callback made them
+    get = cache.get
+
+    def timed_get(path):
+        start = clocks()
+        try:
+            return get(path)
+        finally:
+            metrics.add_load(*since(start))
+    cache.get = timed_get
+
+
+def instrument(app, cache=None):
+    # Call before registering callbacks: every later app.callback is timed.
+    # Also serves /metrics and fills the debug panel from metrics_panel()
+    register = app.callback
+    # Background jobs report through the disk cache their manager already shares
+    manager = app._background_manager
+    jobs = manager.handle if manager is not None else None
+
+    def callback(*args, **kwargs):
+        # Dash adds the callback_map entry here and its dispatcher in decorator()
+        before = set(app.callback_map)
+        decorator = register(*args, **kwargs)
+
+        def wrap(func):
+            if kwargs.get('background'):
+                return decorator(timed_job(func.__name__, func, jobs))
+            result = decorator(timed_body(func))
+            for key in set(app.callback_map) - before:
+                entry = app.callback_map[key]
+                entry['callback'] = timed_request(func.__name__, entry['callback'])
+            return result
+        return wrap
+    app.callback = callback
+    if cache is not None:
+        timed_cache(cache)
+
+    @app.server.route('/metrics')
+    def metrics_endpoint():
+        if request.remote_addr not in LOCAL_ADDRESSES:
+            return Response('forbidden\n', status=403, mimetype='text/plain')
+        if jobs is not None:
+            collect_jobs(jobs)
+        return Response(metrics.render_text(), mimetype='text/plain; version=0.0.4')
+
+    # Registered on the original app.callback so the panel doesn't time itself.
+    # The toggle also starts and stops the poll, so a hidden panel costs nothing
+    @register(
+        Output('metrics-table', 'children'),
+        Output('metrics-poll', 'disabled'),
+        Input('metrics-toggle', 'value'),
+        Input('metrics-poll', 'n_intervals'),
+        prevent_initial_call=True
+    )
+    def refresh_metrics_panel(shown, n_intervals):
+        if not shown:
+            return None, True
+        if jobs is not None:
+            collect_jobs(jobs)
+        return metrics_table(metrics.rows()), False
+
+
+def metrics_table(rows):
+    def ms(seconds, calls):
+        return f'{seconds / calls * 1000:.1f}'
+
+    header = html.Tr([html.Th(label) for label in [
+        'Callback', 'Calls', 'Wall ms', 'Load', 'Compute', 'Serialize', 'CPU ms', 'Max ms', 'Avg KB', 'Max KB', 'Top input'
+    ]])
+    body = []
+    for row in rows:
+        calls = row['calls']
+        top = max(row['triggers'].items(), key=lambda item: item[1]) if row['triggers'] else ('', 0)
+        body.append(html.Tr([
+            html.Td(row['callback']), html.Td(calls),
+            html.Td(ms(sum(row['wall'].values()), calls)),
+            *[html.Td(ms(row['wall'][phase], calls)) for phase in PHASES],
+            html.Td(ms(sum(row['cpu'].values()), calls)),
+            html.Td(f"{row['wall_max'] * 1000:.1f}"),
+            html.Td(f"{row['payload'] / calls / 1024:.1f}"),
+            html.Td(f"{row['payload_max'] / 1024:.1f}"),
+            html.Td(f'{top[0]} ({top[1]})' if top[1] else ''),
+        ]))
+    return html.Table([html.Thead(header), html.Tbody(body)])
+
+
+def metrics_panel():
+    # Hidden by default; refreshed only while shown
+    return html.Div(id='metrics-panel', className='metrics-panel', children=[
+        dcc.Checklist(id='metrics-toggle', options=[{'label': ' Callback metrics', 'value': 'show'}], value=[]),
+        html.Div(id='metrics-table'),
+        dcc.Interval(id='metrics-poll', interval=2000, disabled=True),
+    ])
@@ -1,8 +1,17 @@
 from dash import dcc, html
 import pandas as pd
 import dash_daq as daq
+from utils import FTD_THRESHOLD, POLL_SECONDS, get_ticker_data, list_ticker_files, ticker_mtime, ticker_options
+from fitting import Y_OFFSET_BOUNDS, Y_SCALE_BOUNDS
+from indicators import DEFAULT_SERIES, SERIES
+from instrumentation import ENABLED as INSTRUMENTATION_ENABLED, metrics_panel
 
-def create_layout(latest_date, five_years_ago, csv_files):
+def create_layout():
+    # Dash calls this on every page load, so the ticker list and default dates
+    # are read on the first request rather than when the app is created
+    csv_files = list_ticker_files()
+    latest_date = get_ticker_data(csv_files[0]).df['Date'].max()
+    five_years_ago = latest_date - pd.Timedelta(days=5*365)
     return html.Div(className='main-container', children=[
         html.Div(className='top-row-container', children=[
             html.Button(
@@ -29,7 +38,7 @@ def create_layout(latest_date, five_years_ago, csv_files):
                                     options=[
                                         {'label': 'Volume', 'value': 'volume'},
                                         {'label': 'Open Price', 'value': 'open_price'},
-                                        {'label': 'GME FTD', 'value': 'ftd'}
+                                        {'label': 'FTD', 'value': 'ftd'}
                                     ],
                                     value=['volume', 'open_price'],
                                     inline=True,
@@ -63,6 +72,11 @@ def create_layout(latest_date, five_years_ago, csv_files):
                                         value=dict(hex='#00FF00')
                                     ),
                                 ]),
+                                html.Div(className='color-picker-box', children=[
+                                    # Fails of this many shares or fewer are hidden
+                                    html.Label('FTD Threshold (shares):'),
+                                    dcc.Input(id='ftd-threshold', type='number', min=0, step=1000, value=FTD_THRESHOLD, debounce=True),
+                                ]),
                             ]),
                         ])
                     ])
@@ -70,10 +84,18 @@ def create_layout(latest_date, five_years_ago, csv_files):
             ),
             dcc.Dropdown(
                 id='csv-dropdown',
-                options=[{'label': f.replace('.csv', ''), 'value': f} for f in csv_files],
+                options=ticker_options(csv_files),
                 value=csv_files[0],
                 className='dropdown'
             ),
+            # Price or indicator drawn, overlaid and fitted
+            dcc.Dropdown(
+                id='series-dropdown',
+                options=[{'label': label, 'value': key} for key, (label, _) in SERIES.items()],
+                value=DEFAULT_SERIES,
+                clearable=False,
+                className='dropdown'
+            ),
             html.Div(className='slider-container', children=[
                 html.Div(className='slider-box', children=[
                     html.Label('X-axis Offset:', id='x-offset-label'),
@@ -87,11 +109,11 @@ def create_layout(latest_date, five_years_ago, csv_files):
             html.Div(className='slider-container', children=[
                 html.Div(className='slider-box', children=[
                     html.Label('Y-Axis Offset:', id='y-offset-label'),
-                    dcc.Slider(id='y-offset-slider', min=-200, max=50, value=0, step=1, marks={i: str(i) for i in range(-50, 51, 10)}, updatemode='drag')
+                    dcc.Slider(id='y-offset-slider', min=Y_OFFSET_BOUNDS[0], max=Y_OFFSET_BOUNDS[1], value=0, step=1, marks={i: str(i) for i in range(-50, 51, 10)}, updatemode='drag')
                 ]),
                 html.Div(className='slider-box', children=[
                     html.Label('Y-Axis Scale Factor:', id='y-scale-label'),
-                    dcc.Slider(id='y-scale-slider', min=0, max=10.0, value=1.0, step=0.001, marks={i: str(i) for i in range(0, 11)}, updatemode='drag')
+                    dcc.Slider(id='y-scale-slider', min=Y_SCALE_BOUNDS[0], max=Y_SCALE_BOUNDS[1], value=1.0, step=0.001, marks={i: str(i) for i in range(0, 11)}, updatemode='drag')
                 ]),
             ]),
             html.Div(className='date-picker-container', children=[
@@ -107,6 +129,24 @@ def create_layout(latest_date, five_years_ago, csv_files):
             ]),
         ]),
         html.Button('Calculate Best Fit', id='calculate-best-fit-button', n_clicks=0, className='btn-calculate'),
+        # Cancels a running best-fit job; the bar and status follow its progress
+        html.Button('Cancel Fit', id='cancel-best-fit-button', n_clicks=0, className='btn-calculate', disabled=True),
+        html.Progress(id='fit-progress', value=0, max=1, className='fit-progress'),
+        html.Span(id='fit-status', className='fit-status'),
+        dcc.Store(id='fit-partial'),
+        html.Button('Scan History', id='scan-history-button', n_clicks=0, className='btn-calculate'),
+        # Ranked past windows resembling the overlay; clicking one sets the sliders
+        html.Div(id='pattern-matches', className='pattern-matches'),
+        dcc.Store(id='pattern-store'),
+        html.Button('Search All Tickers', id='cross-ticker-button', n_clicks=0, className='btn-calculate'),
+        html.Span(id='cross-ticker-status', className='fit-status'),
+        html.Div(id='cross-ticker-results', className='cross-ticker-results'),
+        # Untransformed overlay arrays, consumed by the clientside slider transform
+        dcc.Store(id='overlay-store'),
+        # Polls tickerHistory for new or refreshed CSVs, redrawing when the shown
+        # ticker's file is newer than the version this page last drew
+        dcc.Interval(id='ticker-poll', interval=max(POLL_SECONDS, 1) * 1000, disabled=POLL_SECONDS <= 0),
+        dcc.Store(id='drawn-ticker-mtime', data=ticker_mtime(csv_files[0])),
         dcc.Loading(
             id="initial-loading",
             type="default",
@@ -118,4 +158,6 @@ def create_layout(latest_date, five_years_ago, csv_files):
                 dcc.Slider(id='log-scale-slider', min=0, max=100, value=0, step=1, marks={i: str(i) for i in range(101)}, updatemode='drag')
             ]),
         ]),
+        # Collapsed callback timings, only present when instrumentation is enabled
+        *([metrics_panel()] if INSTRUMENTATION_ENABLED else []),
     ])
@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+
+from store import is_fresh, load_columns, read_manifest, sidecar_path, write_columns
+
+# Aggregation levels, coarsest first; the stored rows are the base of the pyramid
+LEVELS = ('Q', 'M', 'W')
+# Finer levels only built over intraday bars: calendar days, then hours
+INTRADAY_LEVELS = ('D', 'h')
+
+
+def is_intraday(dates):
+    # Median spacing under a day; the median ignores overnight and weekend gaps
+    if len(dates) < 2:
+        return False
+    spacing = np.diff(dates[-1024:].astype('datetime64[s]').astype(np.int64))
+    return bool(np.median(spacing) < 86400)
+
+
+def levels_for(dates):
+    return LEVELS + INTRADAY_LEVELS if is_intraday(dates) else LEVELS
+
+
+def level_path(csv_path, level):
+    return f'{sidecar_path(csv_path)}@{level}'
+
+
+def period_keys(dates, level):
+    # Integer period id per row, monotonic in the date
+    if level in INTRADAY_LEVELS:
+        return dates.astype(f'datetime64[{level}]').astype(np.int64)
+    if level == 'W':
+        days = dates.astype('datetime64[D]').astype(np.int64)
+        # 1970-01-01 was a Thursday, so (days + 3) % 7 is 0 on Mondays
+        return days - (days + 3) % 7
+    months = dates.astype('datetime64[M]').astype(np.int64)
+    return months // 3 if level == 'Q' else months
+
+
+def aggregate(daily, level):
+    # OHLCV bars for every period, dated by the period's first trading day.
+    # Rows are sorted by date, so each period is a contiguous run and every
+    # column reduces with one reduceat over the run starts
+    if len(daily) == 0:
+        return daily.iloc[:0].copy()
+    dates = daily['Date'].to_numpy()
+    keys = period_keys(dates, level)
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(keys)) + 1))
+    ends = np.concatenate((starts[1:], [len(keys)])) - 1
+
+    bars = {'Date': dates[starts]}
+    if 'Close' in daily.columns:
+        bars['Close'] = daily['Close'].to_numpy()[ends]
+    bars['Volume'] = np.add.reduceat(daily['Volume'].to_numpy(), starts)
+    bars['Open'] = daily['Open'].to_numpy()[starts]
+    if 'High' in daily.columns:
+        bars['High'] = np.fmax.reduceat(daily['High'].to_numpy(dtype=float), starts)
+    if 'Low' in daily.columns:
+        bars['Low'] = np.fmin.reduceat(daily['Low'].to_numpy(dtype=float), starts)
+    if 'Adj Close' in daily.columns:
+        bars['Adj Close'] = daily['Adj Close'].to_numpy()[ends]
+    return pd.DataFrame(bars)
+
+
+def extend(bars, daily, level):
+    # Re-aggregate only from the start of the last stored period, which may
+    # have been incomplete, and append the result to the stored bars
+    if len(bars) == 0:
+        return aggregate(daily, level)
+    last_period = bars['Date'].to_numpy()[-1]
+    first = np.searchsorted(daily['Date'].to_numpy(), last_period, 'left')
+    tail = aggregate(daily.iloc[first:], level)
+    return pd.concat([bars.iloc[:-1], tail], ignore_index=True)
+
+
+def update_pyramid(csv_path, daily):
+    # Bring every stored level up to date with the daily rows. A level whose
+    # manifest shows it was built from a prefix of these rows is extended
+    # incrementally; anything else (edited history, first build) is rebuilt
+    dates = daily['Date'].to_numpy()
+    for level in levels_for(dates):
+        target = level_path(csv_path, level)
+        try:
+            manifest = read_manifest(target)
+            source_rows, source_last = manifest['source_rows'], np.datetime64(manifest['source_last'], 'ns')
+            appended = 0 < source_rows <= len(daily) and dates[source_rows - 1] == source_last
+        except (FileNotFoundError, KeyError, ValueError):
+            appended = False
+        bars = extend(load_columns(target), daily, level) if appended else aggregate(daily, level)
+        meta = {'source_rows': len(daily), 'source_last': int(dates[-1].astype('datetime64[ns]').astype(np.int64)) if len(daily) else 0}
+        write_columns(target, bars, meta)
+
+
+def load_level(csv_path, level, daily):
+    # Stored bars when they are at least as new as the CSV, else built in memory
+    target = level_path(csv_path, level)
+    if is_fresh(target, csv_path):
+        return load_columns(target)
+    return aggregate(daily, level)
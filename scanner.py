@@ -0,0 +1,141 @@
+import numpy as np
+
+from fitting import DAY, FitProblem
+
+# Window lengths tried, as multiples of the overlay's length in bars
+STRETCH_FACTORS = (0.5, 0.67, 0.8, 1.0, 1.25, 1.5, 2.0)
+# Query rows a coarser pyramid level must keep for scan_ticker to use it
+SCAN_POINTS = 64
+
+
+def sliding_dot(query, series):
+    # Dot product of query with every length-m window of series, via one FFT
+    # convolution: O(n log n) instead of O(n*m)
+    n, m = len(series), len(query)
+    size = 1 << (n + m - 1).bit_length()
+    product = np.fft.irfft(np.fft.rfft(series, size) * np.fft.rfft(query[::-1], size), size)
+    return product[m - 1:n]
+
+
+def rolling_std(series, m):
+    # Population std of every length-m window from cumulative sums
+    csum = np.concatenate(([0.0], np.cumsum(series)))
+    csum2 = np.concatenate(([0.0], np.cumsum(series * series)))
+    mean = (csum[m:] - csum[:-m]) / m
+    var = (csum2[m:] - csum2[:-m]) / m - mean * mean
+    return np.sqrt(np.maximum(var, 0.0))
+
+
+def distance_profile(query, series):
+    # z-normalized Euclidean distance of query to every window of series,
+    # divided by sqrt(m) so profiles for different window lengths compare
+    query = np.asarray(query, dtype=np.float64)
+    series = np.asarray(series, dtype=np.float64)
+    m = len(query)
+    if m < 2 or len(series) < m:
+        return np.empty(0)
+    q_std = query.std()
+    if q_std == 0:
+        return np.full(len(series) - m + 1, np.inf)
+
+    # The normalized query has zero mean, so the window means drop out of the dot product
+    dots = sliding_dot((query - query.mean()) / q_std, series)
+    std = rolling_std(series, m)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        correlation = np.where(std > 0, dots / (m * std), -np.inf)
+    return np.sqrt(np.maximum(2.0 * (1.0 - correlation), 0.0))
+
+
+def resample(values, length):
+    positions = np.linspace(0, len(values) - 1, length)
+    return np.interp(positions, np.arange(len(values)), values)
+
+
+def scan(query, series, k=10, stretch_factors=STRETCH_FACTORS, exclude=None):
+    # Best k non-overlapping windows of series across all stretch factors.
+    # exclude is a (first, last) row range no match may overlap, normally the
+    # query's own rows when scanning a ticker against itself
+    query = np.asarray(query, dtype=np.float64)
+    series = np.asarray(series, dtype=np.float64)
+    # Windows covering an undefined row, such as an indicator's first window,
+    # can't match; zeroing those rows only keeps them out of the FFT
+    missing = ~np.isfinite(series)
+    gaps = np.concatenate(([0], np.cumsum(missing))) if missing.any() else None
+    if gaps is not None:
+        series = np.where(missing, 0.0, series)
+    candidates = []
+    for stretch in stretch_factors:
+        length = int(round(len(query) * stretch))
+        if length < 2 or length > len(series):
+            continue
+        profile = distance_profile(resample(query, length), series)
+        if gaps is not None:
+            profile = np.where(gaps[length:] - gaps[:-length] > 0, np.inf, profile)
+        starts = np.arange(len(profile))
+        if exclude is not None:
+            profile = np.where((starts + length <= exclude[0]) | (starts > exclude[1]), profile, np.inf)
+        # Each stretch contributes at most its own best k, which is all the merge can use
+        best = np.argsort(profile)[:k * 4]
+        candidates.extend((profile[i], int(i), length, stretch) for i in best if np.isfinite(profile[i]))
+
+    matches = []
+    for distance, start, length, stretch in sorted(candidates):
+        # Skip trivial matches: windows mostly covering an already chosen one
+        if any(min(start + length, s + l) - max(start, s) > min(length, l) // 2 for _, s, l, _ in matches):
+            continue
+        matches.append((distance, start, length, stretch))
+        if len(matches) == k:
+            break
+    return [{'start': s, 'length': l, 'stretch': st, 'distance': d} for d, s, l, st in matches]
+
+
+def scan_ticker(ticker, overlay_data, log_scale=0.0, k=10, stretch_factors=STRETCH_FACTORS, column='Open', values=None):
+    # Scan a cached ticker for the overlay's column and translate every match
+    # into the slider values that would line the overlay up on it. values is
+    # the ticker's own series at its stored rows; None means that price
+    # column, which the pyramid levels also have
+    overlay_dates = overlay_data['Date'].to_numpy().astype('datetime64[s]').astype(np.int64)
+    overlay_values = overlay_data[column].to_numpy(dtype=float)
+    # Rows the log transform or an unfilled indicator window leave undefined can't be matched
+    keep = np.isfinite(overlay_values) & ((overlay_values > 0) if log_scale > 0 else True)
+    overlay_dates, overlay_values = overlay_dates[keep], overlay_values[keep]
+    if len(overlay_dates) < 2:
+        return []
+    ref_values = ticker.df[column].to_numpy(dtype=float) if values is None else np.asarray(values, dtype=np.float64)
+
+    # Long overlays are scanned on the coarsest pyramid level that still keeps
+    # SCAN_POINTS query rows; matches are mapped back to daily rows below.
+    # Computed series only exist on the stored rows, so they skip the levels
+    level = ticker.level_for(overlay_dates.min(), overlay_dates.max() + 1, SCAN_POINTS) if values is None else ticker
+    level_values = ref_values if level is ticker else level.df[column].to_numpy(dtype=float)
+    first, last = np.searchsorted(level.dates, [overlay_dates.min(), overlay_dates.max()])
+    if level is ticker:
+        query = overlay_values
+    else:
+        query = level_values[first:np.searchsorted(level.dates, overlay_dates.max(), 'right')]
+    query = np.log(query) if log_scale > 0 else query
+    matches = scan(query, level_values, k, stretch_factors, exclude=(first, last))
+    if not matches:
+        return []
+
+    starts = np.array([m['start'] for m in matches])
+    ends = starts + np.array([m['length'] for m in matches]) - 1
+    if level is not ticker:
+        # A coarse bar ends the day before the next one starts
+        next_starts = np.append(level.dates, np.iinfo(np.int64).max)[ends + 1]
+        starts = np.searchsorted(ticker.dates, level.dates[starts])
+        ends = np.searchsorted(ticker.dates, next_starts) - 1
+    span = float(overlay_dates.max() - overlay_dates.min())
+    moves = (ticker.dates[starts] - overlay_dates.min()) / DAY
+    x_scales = (ticker.dates[ends] - ticker.dates[starts]) / span
+    # Unbounded: applying a match widens the y sliders to fit it
+    problem = FitProblem(overlay_dates, overlay_values, ticker.dates, ref_values, log_scale=log_scale, y_bounds=False)
+    _, y_scales, y_offsets = problem.solve(moves, x_scales)
+
+    for match, start, end, move, x_scale, y_scale, y_offset in zip(matches, starts, ends, moves, x_scales, y_scales, y_offsets):
+        match.update(
+            start=int(start), length=int(end - start + 1), start_date=int(ticker.dates[start]), end_date=int(ticker.dates[end]),
+            move=float(move), x_scale=float(x_scale), y_scale=float(y_scale),
+            y_offset=float(y_offset), log_scale=float(log_scale)
+        )
+    return matches
@@ -0,0 +1,181 @@
+import json
+import os
+import re
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+# Sidecars live next to the CSVs: tickerHistory/.columns/<TICKER>/<column>.npy
+SIDECAR_DIR = '.columns'
+MANIFEST = 'manifest.json'
+PRICE_COLUMNS = ['Close', 'Open', 'High', 'Low', 'Adj Close']
+# Canonical names for the headers seen in Nasdaq and common intraday exports,
+# keyed by lowercased header
+COLUMN_NAMES = {
+    'date': 'Date', 'time': 'Time', 'datetime': 'Datetime', 'timestamp': 'Timestamp',
+    'open': 'Open', 'high': 'High', 'low': 'Low', 'close': 'Close', 'close/last': 'Close',
+    'adj close': 'Adj Close', 'volume': 'Volume',
+}
+# Headers an intraday export may use for its bar timestamps instead of Date
+TIMESTAMP_COLUMNS = ['Datetime', 'Timestamp', 'Time']
+# Timezone intraday bars are shown in. Timestamps with a UTC offset and epoch
+# numbers are converted to it; naive timestamps are taken as already local
+TICKER_TZ = os.environ.get('TICKER_TZ', 'America/New_York')
+# Rows parsed at a time while reading the head of a refreshed export
+HEAD_CHUNK_ROWS = 512
+
+
+def sidecar_path(csv_path):
+    head, name = os.path.split(os.path.abspath(csv_path))
+    return os.path.join(head, SIDECAR_DIR, os.path.splitext(name)[0])
+
+
+def parse_prices(values):
+    # Nasdaq exports prices as '$24.45'; strip currency formatting in one pass
+    series = pd.Series(values)
+    if not pd.api.types.is_numeric_dtype(series):
+        series = series.astype(str).str.replace(r'[\$,\s]', '', regex=True)
+    return pd.to_numeric(series, errors='coerce').to_numpy(dtype=np.float64)
+
+
+def parse_timestamps(values):
+    series = pd.Series(values)
+    if pd.api.types.is_numeric_dtype(series):
+        # Epoch numbers; the unit follows from the magnitude of a current date
+        magnitude = series.abs().max()
+        unit = 's' if magnitude < 1e11 else 'ms' if magnitude < 1e14 else 'us' if magnitude < 1e17 else 'ns'
+        parsed = pd.to_datetime(series, unit=unit, utc=True)
+    elif len(series) and re.search(r'(Z|[+-]\d{2}:?\d{2})$', str(series.iloc[0]).strip()):
+        # Offsets can change within a file at DST switches, so go through UTC
+        parsed = pd.to_datetime(series, utc=True)
+    else:
+        parsed = pd.to_datetime(series)
+    if parsed.dt.tz is not None:
+        parsed = parsed.dt.tz_convert(TICKER_TZ).dt.tz_localize(None)
+    return parsed.astype('datetime64[ns]')
+
+
+def standardize_rows(df):
+    df = df.rename(columns=lambda name: COLUMN_NAMES.get(name.strip().lower(), name))
+    if 'Date' in df.columns and 'Time' in df.columns:
+        # Split date and time-of-day columns
+        df['Date'] = df['Date'].astype(str) + ' ' + df.pop('Time').astype(str)
+    elif 'Date' not in df.columns:
+        column = next((c for c in TIMESTAMP_COLUMNS if c in df.columns), None)
+        if column is None:
+            raise ValueError(f'no Date or timestamp column in {list(df.columns)}')
+        df = df.rename(columns={column: 'Date'})
+    for column in PRICE_COLUMNS:
+        if column in df.columns:
+            df[column] = parse_prices(df[column])
+    if 'Adj Close' not in df.columns:
+        df['Adj Close'] = df['Close']
+    df['Date'] = parse_timestamps(df['Date'])
+    return df
+
+
+def parse_nasdaq_csv(csv_path):
+    df = standardize_rows(pd.read_csv(csv_path))
+    return df.sort_values('Date', kind='stable').reset_index(drop=True)
+
+
+def read_rows_since(csv_path, last):
+    # Rows dated on or after last from a Nasdaq export. Exports list the newest
+    # day first, so only the chunks at the head of the file down to last are
+    # parsed. Returns None for files in any other order, where new rows could
+    # be anywhere and the whole file has to be parsed
+    frames, previous = [], None
+    for chunk in pd.read_csv(csv_path, chunksize=HEAD_CHUNK_ROWS):
+        chunk = standardize_rows(chunk)
+        dates = chunk['Date'].to_numpy()
+        if previous is not None:
+            dates = np.concatenate(([previous], dates))
+        if np.any(dates[1:] > dates[:-1]):
+            return None
+        frames.append(chunk[chunk['Date'].to_numpy() >= last])
+        if dates[-1] <= last:
+            break
+        previous = dates[-1]
+    if not frames:
+        return None
+    return pd.concat(frames, ignore_index=True)
+
+
+def merge_rows(stored, rows):
+    # Stored history followed by the newer export rows, deduplicated on Date.
+    # The export wins on a shared date, since a later download may have
+    # revised the last stored day
+    rows = rows.drop_duplicates('Date').sort_values('Date', kind='stable')
+    rows = rows.reindex(columns=stored.columns)
+    if len(rows) == 0:
+        return stored
+    keep = np.searchsorted(stored['Date'].to_numpy(), rows['Date'].to_numpy()[0], 'left')
+    return pd.concat([stored.iloc[:keep], rows], ignore_index=True)
+
+
+def is_fresh(target, csv_path):
+    try:
+        return os.stat(os.path.join(target, MANIFEST)).st_mtime_ns >= os.stat(csv_path).st_mtime_ns
+    except FileNotFoundError:
+        return False
+
+
+def sidecar_is_fresh(csv_path):
+    return is_fresh(sidecar_path(csv_path), csv_path)
+
+
+def write_columns(target, df, meta=None):
+    parent = os.path.dirname(target)
+    os.makedirs(parent, exist_ok=True)
+
+    # Build the new column set beside the old one and swap it in, so readers
+    # never memory-map a half-written directory
+    staging = tempfile.mkdtemp(dir=parent, prefix='.tmp-')
+    try:
+        columns = []
+        for column in df.columns:
+            values = df[column].to_numpy()
+            if values.dtype == object:
+                values = values.astype(str)
+            np.save(os.path.join(staging, f'{column}.npy'), values)
+            columns.append(column)
+        with open(os.path.join(staging, MANIFEST), 'w') as f:
+            json.dump(dict(meta or {}, columns=columns, rows=len(df)), f)
+
+        retired = None
+        if os.path.exists(target):
+            retired = tempfile.mkdtemp(dir=parent, prefix='.old-')
+            os.rename(target, os.path.join(retired, 'data'))
+        os.rename(staging, target)
+        if retired:
+            shutil.rmtree(retired, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return target
+
+
+def write_sidecar(csv_path, df):
+    return write_columns(sidecar_path(csv_path), df)
+
+
+def read_manifest(target):
+    with open(os.path.join(target, MANIFEST)) as f:
+        return json.load(f)
+
+
+def load_columns(target):
+    manifest = read_manifest(target)
+    # mmap_mode keeps the columns in the shared page cache instead of each
+    # worker's heap; copy=False stops pandas from consolidating them into a copy
+    columns = {
+        column: np.load(os.path.join(target, f'{column}.npy'), mmap_mode='r')
+        for column in manifest['columns']
+    }
+    return pd.DataFrame(columns, copy=False)
+
+
+def load_sidecar(csv_path):
+    return load_columns(sidecar_path(csv_path))
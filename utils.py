@@ -1,75 +1,241 @@
+import os
 import pandas as pd
 import numpy as np
 from datetime import timedelta
-from scipy.optimize import minimize
+from functools import lru_cache
 import plotly.graph_objs as go
+from cache import TickerCache
+from fitting import COARSE_POINTS, FitProblem, best_fit
+from scanner import scan_ticker
+from cross_search import iter_cross_ticker_matches, rank_matches
+from downsample import LOD_POINTS, lod_indices
+from ftd_store import FTD_DIR, load_ftd_store, source_files
+from indicators import DEFAULT_SERIES, RAW_SERIES, SERIES, IndicatorCache, series_column
+from ingest import ingest_ticker
+from pyramid import is_intraday
+from store import parse_nasdaq_csv
+
+TICKER_DIR = os.environ.get('TICKER_DIR', './tickerHistory')
+# Seconds between the dashboard's polls of the ticker directory; 0 disables them
+POLL_SECONDS = float(os.environ.get('TICKER_POLL_SECONDS', 5))
+# Traces with more points than this are drawn with WebGL instead of SVG
+WEBGL_POINTS = int(os.environ.get('WEBGL_POINTS', 5000))
+# Default overlay window: the last 90 days of daily bars, or the last few
+# trading sessions of intraday bars
+OVERLAY_DAYS = 90
+INTRADAY_OVERLAY_SESSIONS = 3
 
 def load_and_standardize_data(file_path):
-    df = pd.read_csv(file_path, parse_dates=['Date'])
-    if 'Close/Last' in df.columns:
-        df.rename(columns={'Close/Last': 'Close'}, inplace=True)
-    if 'Adj Close' not in df.columns:
-        df['Adj Close'] = df['Close']
-    df['Open'] = df['Open'].replace('[\$,]', '', regex=True).astype(float)
-    return df.sort_values('Date')
-
-def calculate_fit(params, overlay_data, df):
-    move, y_scale, x_scale, y_offset, log_scale = map(float, params)
-    overlay_data_moved = overlay_data.copy()
-    overlay_data_moved['Date'] += timedelta(days=move)
-    
-    date_range = overlay_data_moved['Date'].max() - overlay_data_moved['Date'].min()
-    if date_range.total_seconds() != 0:
-        scaled_date_range = date_range * x_scale
-        overlay_data_moved['Date'] = overlay_data_moved['Date'].min() + (overlay_data_moved['Date'] - overlay_data_moved['Date'].min()) / date_range * scaled_date_range
+    # Memory-map the columnar sidecar when it is newer than the CSV, otherwise
+    # append the CSV's new rows to it (or build it) first
+    try:
+        return ingest_ticker(file_path)[1]
+    except OSError:
+        # Read-only checkouts still work, they just parse the CSV every cold load
+        return parse_nasdaq_csv(file_path)
 
-    overlay_log_scaled_data = np.log(overlay_data_moved['Open']) * log_scale if log_scale > 0 else overlay_data_moved['Open']
-    overlay_scaled_data = overlay_log_scaled_data * y_scale + y_offset
+ticker_cache = TickerCache(load_and_standardize_data)
+indicator_cache = IndicatorCache()
 
-    interpolated_five_year = np.interp(overlay_data_moved['Date'].astype('int64') // 10**9, df['Date'].astype('int64') // 10**9, df['Open'])
-    diff = interpolated_five_year - overlay_scaled_data
-    return np.sum(diff**2)
+# How long each FTD line extends past its settlement date
+FTD_SPAN = pd.Timedelta(days=35)
 
-def update_graph(
-    df, ftd_df, csv_file, use_date_range, start_date, end_date, 
-    five_year_start, five_year_end, move, y_scale, x_scale, 
-    y_offset, log_scale, trace_toggle, relayoutData,
-    static_chart_color='#0000FF', overlay_color='#FF0000', ftd_lines_color='#00FF00'
-):
-    df = load_and_standardize_data(f'./tickerHistory/{csv_file}')
-    latest_date = df['Date'].max()
-    three_months_ago = latest_date - pd.Timedelta(days=90)
-    five_years_ago = latest_date - pd.Timedelta(days=5*365)
-    three_months_data = df[(df['Date'] >= three_months_ago) & (df['Date'] <= latest_date)]
+# Fails below this many shares are hidden until the threshold input is changed
+FTD_THRESHOLD = 150000
+
+@lru_cache(maxsize=1)
+def _cached_ftd_store(directory, sources):
+    return load_ftd_store(directory)
+
+def get_ftd_store(directory=FTD_DIR):
+    # Rebuilt or extended only when a file in the FTD directory is added or changes
+    return _cached_ftd_store(os.path.abspath(directory), frozenset(source_files(directory).items()))
+
+def ticker_symbol(csv_file):
+    return os.path.splitext(os.path.basename(csv_file))[0].upper()
+
+def load_ftd_data(store, symbol, threshold=FTD_THRESHOLD):
+    ftd_df = store.query(symbol, threshold=threshold)
+
+    # Precompute everything build_ftd_trace needs so callbacks never format per row
+    start = ftd_df['SETTLEMENT DATE']
+    end = start + FTD_SPAN
+    ftd_df['START X'] = start.dt.strftime('%Y-%m-%d')
+    ftd_df['END X'] = end.dt.strftime('%Y-%m-%d')
+    ftd_df['HOVER'] = (
+        'FTD from ' + start.dt.strftime('%b %d, %Y') + ' to ' + end.dt.strftime('%b %d, %Y')
+        + ', Price: ' + ftd_df['PRICE'].map('{:.2f}'.format)
+    )
+    return ftd_df
+
+@lru_cache(maxsize=32)
+def _cached_ftd_data(store, symbol, threshold):
+    return load_ftd_data(store, symbol, threshold)
+
+def get_ftd_data(csv_file, threshold=FTD_THRESHOLD):
+    # The selected ticker's fails above threshold, sliced from the store once
+    # per store version and threshold
+    return _cached_ftd_data(get_ftd_store(), ticker_symbol(csv_file), threshold or 0)
+
+def list_ticker_files(directory=TICKER_DIR):
+    csv_files = sorted(f for f in os.listdir(directory) if f.endswith('.csv'))
+    if 'GME.csv' in csv_files:
+        csv_files.remove('GME.csv')
+        csv_files.insert(0, 'GME.csv')
+    return csv_files
 
+def ticker_options(csv_files):
+    return [{'label': f.replace('.csv', ''), 'value': f} for f in csv_files]
+
+def ticker_path(csv_file):
+    return os.path.join(TICKER_DIR, csv_file)
+
+def ticker_mtime(csv_file):
+    # Same clock the ticker cache keys on; None once the file is gone
+    try:
+        return os.stat(ticker_path(csv_file)).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+def get_ticker_data(csv_file):
+    return ticker_cache.get(ticker_path(csv_file))
+
+def series_frame(ticker, series=DEFAULT_SERIES):
+    # The ticker's rows with the series in a column named by its label
+    if series in RAW_SERIES:
+        return ticker.df
+    return ticker.df.assign(**{series_column(series): indicator_cache.get(ticker, series)})
+
+def series_title(series):
+    return 'Open Price' if series == DEFAULT_SERIES else series_column(series)
+
+def series_values(ticker, series=DEFAULT_SERIES):
+    if series == DEFAULT_SERIES:
+        return ticker.open
+    return series_frame(ticker, series)[series_column(series)].to_numpy(dtype=float)
+
+def to_epoch_seconds(value):
+    return int(pd.Timestamp(value).to_datetime64().astype('datetime64[s]').astype(np.int64))
+
+def historic_frame(csv_file, view_range, series=DEFAULT_SERIES):
+    # (price, volume) frames for the historic traces. Price comes from the
+    # coarsest pyramid level that still gives the visible range LOD_POINTS
+    # rows, so long ranges are drawn from weekly/monthly bars, not every day.
+    # Volume always comes from the stored rows: a level's volume is summed per
+    # period, and it shares an axis with the overlay's per-bar volume.
+    # Indicators are always drawn from the stored rows, where a 20-bar mean
+    # is the one the overlay and fit use, and only thinned by LOD
+    ticker = get_ticker_data(csv_file)
+    if LOD_POINTS <= 0 or series not in RAW_SERIES:
+        return series_frame(ticker, series), ticker.df
+    return ticker.level_for(to_epoch_seconds(view_range[0]), to_epoch_seconds(view_range[1]), LOD_POINTS).df, ticker.df
+
+def range_end(end_date):
+    # Date pickers send bare dates; for intraday bars those mean the whole day
+    end = pd.Timestamp(end_date)
+    return end + pd.Timedelta(days=1) - pd.Timedelta(1, 'ns') if end == end.normalize() else end
+
+def in_range(df, start_date, end_date):
+    return df[(df['Date'] >= pd.Timestamp(start_date)) & (df['Date'] <= range_end(end_date))]
+
+def default_overlay_start(df):
+    dates = df['Date'].to_numpy()
+    if not is_intraday(dates):
+        return df['Date'].max() - pd.Timedelta(days=OVERLAY_DAYS)
+    # Step back one session at a time from the last bar's day
+    day = dates[-1].astype('datetime64[D]')
+    for _ in range(INTRADAY_OVERLAY_SESSIONS - 1):
+        first = np.searchsorted(dates, day.astype(dates.dtype))
+        if first == 0:
+            break
+        day = dates[first - 1].astype('datetime64[D]')
+    return pd.Timestamp(day)
+
+def select_overlay_data(df, use_date_range, start_date, end_date):
+    if use_date_range == 'yes' and start_date and end_date:
+        return in_range(df, start_date, end_date)
+    return df[df['Date'] >= default_overlay_start(df)]
+
+def date_labels(dates):
+    # Hover labels, with the time of day for intraday bars
+    return dates.dt.strftime('%b %d, %Y %H:%M' if is_intraday(dates.to_numpy()) else '%b %d, %Y')
+
+def scatter_type(points):
+    # SVG redraws stall the browser at tens of thousands of points; WebGL doesn't
+    return go.Scattergl if points > WEBGL_POINTS else go.Scatter
+
+def volume_trace(x, y, name, color, **kwargs):
+    # Bars have no WebGL version, so long volume series become a filled step line
+    if len(x) > WEBGL_POINTS:
+        return go.Scattergl(x=x, y=y, name=name, mode='lines', line=dict(color=color, width=0, shape='hv'),
+                            fill='tozeroy', fillcolor=color, **kwargs)
+    return go.Bar(x=x, y=y, name=name, marker=dict(color=color), **kwargs)
+
+def overlay_store_data(overlay_data, series=DEFAULT_SERIES):
+    # Untransformed overlay arrays for the clientside slider transform (assets/overlay.js).
+    # Indicator gaps go out as null
+    values = overlay_data[series_column(series)].to_numpy(dtype=float)
+    return {
+        'dates': overlay_data['Date'].to_numpy().astype('datetime64[ms]').astype(np.int64).tolist(),
+        'values': np.where(np.isfinite(values), values, None).tolist(),
+        'volume': overlay_data['Volume'].astype(float).tolist(),
+    }
+
+# Traces are always emitted in this order, hidden rather than dropped when toggled
+# off, so callbacks can patch a single trace by index
+HISTORIC_TRACE, OVERLAY_TRACE, VOLUME_TRACE, OVERLAY_VOLUME_TRACE, FTD_TRACE = range(5)
+
+def default_ranges(df, start_date, end_date, five_year_start, five_year_end):
+    latest_date = df['Date'].max()
     if start_date is None:
-        start_date = three_months_ago
+        start_date = default_overlay_start(df)
     if end_date is None:
         end_date = latest_date
     if five_year_start is None:
-        five_year_start = five_years_ago
+        five_year_start = latest_date - pd.Timedelta(days=5*365)
     if five_year_end is None:
         five_year_end = latest_date
+    return start_date, end_date, five_year_start, five_year_end
 
+def build_historic_traces(df, volume_df, five_year_start, five_year_end, trace_toggle, static_chart_color='#0000FF', view_range=None, series=DEFAULT_SERIES):
+    column, value_format = SERIES[series]
+    five_year_data = in_range(df, five_year_start, five_year_end)
+    five_year_volume = in_range(volume_df, five_year_start, five_year_end)
+
+    # Level of detail: full resolution only for the part of the range on screen
+    view = None
+    if view_range:
+        view = (pd.Timestamp(view_range[0]).to_datetime64(), pd.Timestamp(view_range[1]).to_datetime64())
+    volume_data = five_year_volume.iloc[lod_indices(five_year_volume['Date'].to_numpy(), five_year_volume['Volume'], view, method='minmax')]
+    # Indicators are undefined until their first window fills
+    price_data = five_year_data[five_year_data[column].notna()]
+    price_data = price_data.iloc[lod_indices(price_data['Date'].to_numpy(), price_data[column], view)]
+
+    trace_five_year = scatter_type(len(price_data))(
+        x=price_data['Date'], y=price_data[column], mode='lines', name='Historic Data',
+        text=date_labels(price_data['Date']), hovertemplate=f'%{{text}}, %{{y:{value_format}}}', line=dict(color=static_chart_color),
+        visible='open_price' in trace_toggle
+    )
+    volume_five_year = volume_trace(
+        volume_data['Date'], volume_data['Volume'], 'Volume', 'rgba(50, 50, 150, 0.5)',
+        yaxis='y2', visible='volume' in trace_toggle
+    )
+    return trace_five_year, volume_five_year
+
+def build_overlay_traces(
+    df, use_date_range, start_date, end_date, move, y_scale, x_scale,
+    y_offset, log_scale, trace_toggle, overlay_color='#FF0000', series=DEFAULT_SERIES
+):
+    column, value_format = SERIES[series]
     move = float(move)
     y_scale = float(y_scale)
     x_scale = float(x_scale)
     y_offset = float(y_offset)
     log_scale = float(log_scale)
 
-    five_year_data = df[(df['Date'] >= five_year_start) & (df['Date'] <= five_year_end)]
-    trace_five_year = go.Scatter(
-        x=five_year_data['Date'], y=five_year_data['Open'], mode='lines', name='Historic Data',
-        text=five_year_data['Date'].dt.strftime('%b %d, %Y'), hovertemplate='%{text}, %{y:.2f}', line=dict(color=static_chart_color)
-    )
-    volume_five_year = go.Bar(
-        x=five_year_data['Date'], y=five_year_data['Volume'], name='Volume', marker=dict(color='rgba(50, 50, 150, 0.5)'),
-        yaxis='y2'
-    )
-
-    overlay_data = df[(df['Date'] >= start_date) & (df['Date'] <= end_date)] if use_date_range == 'yes' else three_months_data.copy()
+    overlay_data = select_overlay_data(df, use_date_range, start_date, end_date).copy()
     overlay_data['Original Date'] = overlay_data['Date']
-    overlay_data['Original Open'] = overlay_data['Open']
+    overlay_data['Original Value'] = overlay_data[column]
     overlay_data['Original Volume'] = overlay_data['Volume']
     overlay_data['Date'] += timedelta(days=move)
 
@@ -78,49 +244,83 @@ def update_graph(
         scaled_date_range = date_range * x_scale
         overlay_data['Date'] = overlay_data['Date'].min() + (overlay_data['Date'] - overlay_data['Date'].min()) / date_range * scaled_date_range
 
-    overlay_log_scaled_data = np.log(overlay_data['Open']) * log_scale if log_scale > 0 else overlay_data['Open']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        overlay_log_scaled_data = np.log(overlay_data[column]) * log_scale if log_scale > 0 else overlay_data[column]
     overlay_scaled_data = overlay_log_scaled_data * y_scale + y_offset
     overlay_scaled_volume = overlay_data['Volume'] * y_scale
 
-    trace_overlay = go.Scatter(
+    labels = date_labels(overlay_data['Original Date'])
+    trace_overlay = scatter_type(len(overlay_data))(
         x=overlay_data['Date'], y=overlay_scaled_data, mode='lines', name='Overlay Data',
-        text=overlay_data['Original Date'].dt.strftime('%b %d, %Y'), hovertemplate='%{text}, %{y:.2f} (Original: %{customdata[0]:.2f})',
-        customdata=np.stack((overlay_data['Original Open'],), axis=-1), line=dict(color=overlay_color)
+        text=labels, hovertemplate=f'%{{text}}, %{{y:{value_format}}} (Original: %{{customdata[0]:{value_format}}})',
+        customdata=np.stack((overlay_data['Original Value'],), axis=-1), line=dict(color=overlay_color),
+        visible='open_price' in trace_toggle
     )
-    volume_overlay = go.Bar(
-        x=overlay_data['Date'], y=overlay_scaled_volume, name='Overlay Volume',
-        marker=dict(color='rgba(150, 50, 50, 0.5)'), yaxis='y2',
-        text=overlay_data['Original Date'].dt.strftime('%b %d, %Y'), hovertemplate='%{text}, %{y} (Original: %{customdata[0]})',
-        customdata=np.stack((overlay_data['Original Volume'].apply(format_volume),), axis=-1)
+    volume_overlay = volume_trace(
+        overlay_data['Date'], overlay_scaled_volume, 'Overlay Volume', 'rgba(150, 50, 50, 0.5)', yaxis='y2',
+        text=labels, hovertemplate='%{text}, %{y} (Original: %{customdata[0]})',
+        customdata=np.stack((overlay_data['Original Volume'].apply(format_volume),), axis=-1),
+        visible='volume' in trace_toggle
     )
+    return trace_overlay, volume_overlay
 
-    ftd_lines = [
-        go.Scatter(
-            x=[row['SETTLEMENT DATE'], row['SETTLEMENT DATE'] + pd.Timedelta(days=35)],
-            y=[row['PRICE'], row['PRICE']],
-            mode='lines',
-            name=row['SETTLEMENT DATE'].strftime('%Y-%m-%d'),
-            line=dict(color=ftd_lines_color, width=1),
-            hovertext=f"FTD from {row['SETTLEMENT DATE'].strftime('%b %d, %Y')} to {(row['SETTLEMENT DATE'] + pd.Timedelta(days=35)).strftime('%b %d, %Y')}, Price: {row['PRICE']:.2f}",
-            hoverinfo='text'
-        )
-        for _, row in ftd_df.iterrows()
-    ]
+def build_ftd_trace(ftd_df, trace_toggle, ftd_lines_color='#00FF00', x_range=None):
+    # Hidden placeholder keeps FTD_TRACE addressable while the toggle is off
+    if 'ftd' not in trace_toggle or ftd_df.empty:
+        return go.Scatter(x=[], y=[], mode='lines', name='FTD', line=dict(color=ftd_lines_color, width=1), visible=False)
+
+    # Rows are sorted by settlement date, so the visible window is a slice
+    starts = ftd_df['SETTLEMENT DATE'].to_numpy()
+    first, last = 0, len(starts)
+    if x_range:
+        first = np.searchsorted(starts, (pd.Timestamp(x_range[0]) - FTD_SPAN).to_datetime64(), 'left')
+        last = np.searchsorted(starts, pd.Timestamp(x_range[1]).to_datetime64(), 'right')
+    rows = ftd_df.iloc[first:last]
+
+    # One trace of [start, end, None] segments instead of one trace per fail
+    x = np.full(3 * len(rows), None, dtype=object)
+    y = np.full(3 * len(rows), None, dtype=object)
+    hovertext = np.full(3 * len(rows), None, dtype=object)
+    x[0::3] = rows['START X'].to_numpy()
+    x[1::3] = rows['END X'].to_numpy()
+    y[0::3] = y[1::3] = rows['PRICE'].to_numpy()
+    hovertext[0::3] = hovertext[1::3] = rows['HOVER'].to_numpy()
+
+    return scatter_type(len(x))(
+        x=x, y=y, mode='lines', name='FTD', connectgaps=False,
+        line=dict(color=ftd_lines_color, width=1),
+        hovertext=hovertext, hoverinfo='text', visible=True
+    )
+
+def update_graph(
+    df, ftd_df, csv_file, use_date_range, start_date, end_date, 
+    five_year_start, five_year_end, move, y_scale, x_scale, 
+    y_offset, log_scale, trace_toggle, relayoutData,
+    static_chart_color='#0000FF', overlay_color='#FF0000', ftd_lines_color='#00FF00', series=DEFAULT_SERIES
+):
+    df = series_frame(get_ticker_data(csv_file), series)
+    start_date, end_date, five_year_start, five_year_end = default_ranges(
+        df, start_date, end_date, five_year_start, five_year_end
+    )
 
-    data = []
-    if 'ftd' in trace_toggle:
-        data.extend(ftd_lines)
-    if 'open_price' in trace_toggle:
-        data.append(trace_five_year)
-        data.append(trace_overlay)
-    if 'volume' in trace_toggle:
-        data.append(volume_five_year)
-        data.append(volume_overlay)
+    visible_range = [start_date, end_date] if use_date_range == 'yes' else [five_year_start, five_year_end]
+    trace_five_year, volume_five_year = build_historic_traces(
+        *historic_frame(csv_file, visible_range, series), five_year_start, five_year_end, trace_toggle, static_chart_color,
+        visible_range, series
+    )
+    trace_overlay, volume_overlay = build_overlay_traces(
+        df, use_date_range, start_date, end_date, move, y_scale, x_scale,
+        y_offset, log_scale, trace_toggle, overlay_color, series
+    )
+    data = [
+        trace_five_year, trace_overlay, volume_five_year, volume_overlay,
+        build_ftd_trace(ftd_df, trace_toggle, ftd_lines_color, visible_range)
+    ]
 
     layout = go.Layout(
         title='Stock Data: Static and Overlay',
         xaxis={'title': 'Date', 'range': [df['Date'].min(), df['Date'].max()]},
-        yaxis={'title': 'Open Price'},
+        yaxis={'title': series_title(series)},
         yaxis2=dict(title='Volume', overlaying='y', side='right', showgrid=True),
         showlegend=True,
         plot_bgcolor='#1e1e1e',
@@ -146,21 +346,75 @@ def update_graph(
     return {'data': data, 'layout': layout}
 
 
-def calculate_best_fit(df, three_months_data, n_clicks, move, y_scale, x_scale, y_offset, log_scale, use_date_range, start_date, end_date):
-    if n_clicks == 0:
+def calculate_best_fit(
+    csv_file, n_clicks, move, y_scale, x_scale, y_offset, log_scale, use_date_range, start_date, end_date,
+    series=DEFAULT_SERIES, progress=None
+):
+    # progress, if given, is passed to best_fit and sees every improvement in slider units
+    if n_clicks == 0 or csv_file is None:
         return move, y_scale, x_scale, y_offset, log_scale
 
-    move = float(move)
-    y_scale = float(y_scale)
-    x_scale = float(x_scale)
-    y_offset = float(y_offset)
-    log_scale = float(log_scale)
+    ticker = get_ticker_data(csv_file)
+    overlay_data = select_overlay_data(series_frame(ticker, series), use_date_range, start_date, end_date)
+    overlay_values = overlay_data[series_column(series)].to_numpy(dtype=float)
+    # Rows the log transform or an unfilled indicator window leave undefined can't be fitted
+    keep = np.isfinite(overlay_values) & ((overlay_values > 0) if float(log_scale) > 0 else True)
+    if keep.sum() < 2:
+        return move, y_scale, x_scale, y_offset, log_scale
+
+    overlay_dates = overlay_data['Date'].to_numpy().astype('datetime64[s]').astype(np.int64)[keep]
+    exclude = (overlay_dates.min(), overlay_dates.max())
+    problem = FitProblem(
+        overlay_dates, overlay_values[keep], ticker.dates, series_values(ticker, series),
+        log_scale=float(log_scale), exclude=exclude
+    )
+    # Screen the grid on the coarsest pyramid level that still resolves the
+    # overlay. Indicators only exist on the stored rows, so they skip it
+    coarse = None
+    level = ticker.level_for(exclude[0], exclude[1] + 1, COARSE_POINTS) if series in RAW_SERIES else ticker
+    if level is not ticker:
+        first, last = np.searchsorted(level.dates, [exclude[0], exclude[1] + 1])
+        level_values = series_values(level, series)
+        coarse = FitProblem(
+            level.dates[first:last], level_values[first:last], level.dates, level_values,
+            log_scale=float(log_scale), exclude=exclude
+        )
+    fits = best_fit(problem, seeds=[(float(move), float(x_scale))], coarse=coarse, progress=progress)
+    if not fits:
+        return move, y_scale, x_scale, y_offset, log_scale
+
+    best = fits[0]
+    return float(best['move']), float(best['y_scale']), float(best['x_scale']), float(best['y_offset']), float(log_scale)
+
+def scan_history(csv_file, log_scale, use_date_range, start_date, end_date, k=10, series=DEFAULT_SERIES):
+    if csv_file is None:
+        return []
+    ticker = get_ticker_data(csv_file)
+    overlay_data = select_overlay_data(series_frame(ticker, series), use_date_range, start_date, end_date)
+    # Price series are scanned on the pyramid levels, indicators on the stored rows
+    values = None if series in RAW_SERIES else series_values(ticker, series)
+    return scan_ticker(ticker, overlay_data, float(log_scale), k, column=series_column(series), values=values)
 
-    overlay_data = df[(df['Date'] >= start_date) & (df['Date'] <= end_date)] if use_date_range == 'yes' else three_months_data.copy()
-    initial_params = [move, y_scale, x_scale, y_offset, log_scale]
-    result = minimize(calculate_fit, initial_params, args=(overlay_data, df), method='Nelder-Mead')
-    
-    return result.x[0], result.x[1], result.x[2], result.x[3], result.x[4]
+def search_all_tickers(csv_file, log_scale, use_date_range, start_date, end_date, progress=None):
+    # progress, if given, sees the ranking so far each time a ticker finishes,
+    # as progress(rows, done, total)
+    if csv_file is None:
+        return []
+    overlay_data = select_overlay_data(get_ticker_data(csv_file).df, use_date_range, start_date, end_date)
+    # A custom range with no rows leaves nothing to search for
+    if len(overlay_data) < 2:
+        return []
+    query = overlay_data['Open'].to_numpy(dtype=float)
+    if float(log_scale) > 0:
+        query = np.log(query)
+    query_dates = overlay_data['Date'].to_numpy().astype('datetime64[s]').astype(np.int64)
+    tickers = [(name, get_ticker_data(name)) for name in list_ticker_files()]
+    results = []
+    for result in iter_cross_ticker_matches(query, query_dates, tickers, source=csv_file):
+        results.append(result)
+        if progress is not None:
+            progress(rank_matches(results), len(results), len(tickers))
+    return rank_matches(results)
 
 def format_volume(volume):
     if volume >= 1e9: